@@ -0,0 +1,112 @@
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from .cache import record
+
+AUTH = 'auth_token'
+DEFERRED_FIELDS = ('password', 'recipes_count', 'followers_count')
+
+
+def shared_key(key):
+    return 'auth-token:{}'.format(hashlib.sha256(key.encode()).hexdigest())
+
+
+class TokenCache:
+    """Снимки пользователей по токену: LRU с TTL в процессе и, если
+    включен AUTH_TOKEN_SHARED_CACHE, общий кеш Django.
+
+    Пароль и счетчики в снимок не попадают: они загружаются при
+    обращении, а save() снимка их не перезаписывает. Каждый запрос
+    получает свою копию пользователя.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._users.get(key)
+            if item is not None:
+                if item[0] > now:
+                    self._users.move_to_end(key)
+                    record('hit', AUTH)
+                    return copy.copy(item[1])
+                del self._users[key]
+        if settings.AUTH_TOKEN_SHARED_CACHE:
+            user = cache.get(shared_key(key))
+            if user is not None:
+                record('shared_hit', AUTH)
+                self._store(key, user)
+                return copy.copy(user)
+        record('miss', AUTH)
+        return None
+
+    def set(self, key, user):
+        self._store(key, user)
+        if settings.AUTH_TOKEN_SHARED_CACHE:
+            cache.set(
+                shared_key(key), user, settings.AUTH_TOKEN_CACHE_TTL
+            )
+
+    def _store(self, key, user):
+        with self._lock:
+            self._users[key] = (
+                time.monotonic() + settings.AUTH_TOKEN_CACHE_TTL, user
+            )
+            self._users.move_to_end(key)
+            while len(self._users) > settings.AUTH_TOKEN_CACHE_SIZE:
+                self._users.popitem(last=False)
+
+    def invalidate(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._users.pop(key, None)
+        if settings.AUTH_TOKEN_SHARED_CACHE:
+            cache.delete_many([shared_key(key) for key in keys])
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+token_cache = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе для знакомых токенов.
+
+    Снимок сбрасывается при удалении токена (выход, смена пароля) и
+    сохранении пользователя, в других процессах он живет не дольше
+    AUTH_TOKEN_CACHE_TTL.
+    """
+
+    def authenticate_credentials(self, key):
+        if settings.AUTH_TOKEN_CACHE_TTL <= 0:
+            return super().authenticate_credentials(key)
+        user = token_cache.get(key)
+        if user is None:
+            try:
+                token = Token.objects.select_related('user').defer(
+                    *(f'user__{field}' for field in DEFERRED_FIELDS)
+                ).get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            user = token.user
+            token_cache.set(key, copy.copy(user))
+        if not user.is_active:
+            raise exceptions.AuthenticationFailed(
+                _('User inactive or deleted.')
+            )
+        return user, Token(key=key, user=user)
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import math
+import threading
+import time
+import tracemalloc
+
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+
+from users.models import User
+
+
+def percentile(samples, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(samples)
+    rank = max(math.ceil(percent / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class QueryCounter:
+    """Считает запросы к БД.
+
+    CaptureQueriesContext здесь не подходит: сигнал request_started
+    очищает connection.queries посреди замера.
+    """
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def consume(response):
+    if response.streaming:
+        return b''.join(response.streaming_content)
+    return response.content
+
+
+def run_scenario(client, path, iterations, warmup=3, **extra):
+    """Замеры одного адреса.
+
+    Время меряется без перехвата запросов и tracemalloc, число запросов
+    к БД и выделенная память — отдельным проходом после основного.
+    """
+    for _ in range(warmup):
+        consume(client.get(path, **extra))
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.get(path, **extra)
+        consume(response)
+        timings.append((time.perf_counter() - started) * 1000)
+    if response.status_code != 200:
+        raise RuntimeError(f'{path}: статус {response.status_code}')
+    queries = QueryCounter()
+    with connection.execute_wrapper(queries):
+        consume(client.get(path, **extra))
+    tracemalloc.start()
+    try:
+        consume(client.get(path, **extra))
+        allocated, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'path': path,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'queries': queries.count,
+        'alloc_kb': round(allocated / 1024, 1),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def benchmark_user(username=None):
+    """Пользователь для авторизованных замеров.
+
+    По умолчанию тот, у кого больше всего подписок и покупок.
+    """
+    if username:
+        return User.objects.filter(username=username).first()
+    return User.objects.annotate(
+        activity=Count('follower', distinct=True)
+        + Count('shopping_cart', distinct=True)
+    ).order_by('-activity', 'id').first()
+
+
+def make_client(token=None):
+    client = Client(HTTP_HOST='localhost')
+    if token is not None:
+        client.defaults['HTTP_AUTHORIZATION'] = f'Token {token}'
+    return client
+
+
+def compare(results, baseline, tolerance, noise_ms=1.0):
+    """Регрессии относительно базового прогона.
+
+    Число запросов к БД сравнивается без допуска, память — с допуском
+    tolerance (доля); это жесткие проверки. Время зависит от машины и
+    ее загрузки, поэтому рост медианы выше допуска и шума noise_ms
+    только предупреждение. Возвращает пару (регрессии, предупреждения).
+    """
+    regressions = []
+    warnings = []
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if result['queries'] > old['queries']:
+            regressions.append(
+                f'{name}: запросов {old["queries"]} -> {result["queries"]}'
+            )
+        for metric in ('alloc_kb', 'peak_kb'):
+            if result[metric] > old[metric] * (1 + tolerance):
+                regressions.append(
+                    f'{name}: {metric} {old[metric]} -> {result[metric]}'
+                )
+        limit = max(old['p50_ms'] * (1 + tolerance), old['p50_ms'] + noise_ms)
+        if result['p50_ms'] > limit:
+            warnings.append(
+                f'{name}: p50_ms {old["p50_ms"]} -> {result["p50_ms"]}'
+            )
+    return regressions, warnings
+
+
+def load_baseline(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)['results']
+
+
+def save_baseline(path, results, **meta):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(
+            {'meta': meta, 'results': results},
+            file,
+            ensure_ascii=False,
+            indent=2,
+            sort_keys=True,
+        )
+
+
+class LatencyProxy:
+    """TCP-прокси к Postgres, задерживающий каждую посылку к базе.
+
+    Изображает базу на другой машине: ожидание сети, которого нет у
+    локального сервера. Работает в своем потоке с циклом событий.
+    """
+
+    def __init__(self, host, port, latency):
+        self.host = host
+        self.port = int(port or 5432)
+        self.latency = latency
+        self.loop = asyncio.new_event_loop()
+        self.listen_port = None
+
+    def start(self):
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.server = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle, '127.0.0.1', 0), self.loop
+        ).result()
+        self.listen_port = self.server.sockets[0].getsockname()[1]
+        return self.listen_port
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def handle(self, reader, writer):
+        if self.host.startswith('/'):
+            upstream = await asyncio.open_unix_connection(
+                f'{self.host}/.s.PGSQL.{self.port}'
+            )
+        else:
+            upstream = await asyncio.open_connection(self.host, self.port)
+        await asyncio.gather(
+            self.pipe(reader, upstream[1], self.latency),
+            self.pipe(upstream[0], writer, 0),
+        )
+
+    async def pipe(self, reader, writer, delay):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,155 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import http_date, quote_etag
+from foodgram_backend.db.routers import use_primary
+from rest_framework.response import Response
+
+TAGS = 'tags'
+INGREDIENTS = 'ingredients'
+RECIPES = 'recipes'
+
+stats = Counter()
+stats_lock = threading.Lock()
+
+
+def record(event, namespace):
+    with stats_lock:
+        stats[event, namespace] += 1
+
+
+def get_stats():
+    """Попадания и промахи кеша ответов в этом процессе."""
+    with stats_lock:
+        return dict(stats)
+
+
+def version_key(namespace):
+    return f'api-version:{namespace}'
+
+
+def recipe_namespace(recipe_id):
+    """Пространство карточки одного рецепта."""
+    return f'recipe:{recipe_id}'
+
+
+def author_namespace(user_id):
+    """Пространство данных автора в карточках его рецептов."""
+    return f'author:{user_id}'
+
+
+def get_versions(namespaces):
+    """Версии пространств имен кеша.
+
+    Версия — время последнего изменения данных; она же служит
+    Last-Modified ответа.
+    """
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*namespaces):
+    """Сбрасывает кеш пространств имен после фиксации транзакции."""
+    def set_versions():
+        now = time.time()
+        cache.set_many(
+            {version_key(namespace): now for namespace in namespaces}, None
+        )
+    transaction.on_commit(set_versions)
+
+
+def fresh_reads(versions):
+    """Чтение из основной базы, если данные менялись только что.
+
+    Иначе отстающая реплика заполнила бы кеш старыми данными под новой
+    версией.
+    """
+    if time.time() - max(versions) < settings.DB_REPLICA_STICKY_SECONDS:
+        return use_primary()
+    return nullcontext()
+
+
+class CachedResponseMixin:
+    """Кеш ответов list/retrieve для вьюсетов.
+
+    Ключ кеша строится из версий cache_namespaces и полного адреса
+    запроса вместе с хостом, от которого зависят ссылки на картинки,
+    поэтому при изменении данных старые записи просто перестают
+    использоваться. Ответ получает ETag и Last-Modified, повторный
+    условный запрос без изменений отдает 304.
+    """
+    cache_namespaces = ()
+    cached_actions = ('list', 'retrieve')
+    cache_anonymous_only = False
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def is_cacheable(self, request):
+        if self.action not in self.cached_actions:
+            return False
+        return not (
+            self.cache_anonymous_only and request.user.is_authenticated
+        )
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        namespace = self.cache_namespaces[0]
+        versions = get_versions(self.cache_namespaces)
+        key = hashlib.md5(
+            f'{versions}{request.build_absolute_uri()}'
+            f'{request.accepted_renderer.format}'.encode()
+        ).hexdigest()
+        etag = quote_etag(key)
+        last_modified = int(max(versions))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is not None:
+            record('not_modified', namespace)
+        else:
+            data = cache.get(f'api-response:{key}')
+            if data is not None:
+                record('hit', namespace)
+                response = Response(data)
+            else:
+                record('miss', namespace)
+                with fresh_reads(versions):
+                    response = handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(
+                    f'api-response:{key}',
+                    response.data,
+                    settings.API_CACHE_TIMEOUT,
+                )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(
+            response, public=True, max_age=settings.API_CACHE_MAX_AGE
+        )
+        if self.cache_anonymous_only:
+            patch_vary_headers(response, ('Authorization',))
+        return response
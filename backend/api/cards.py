@@ -0,0 +1,134 @@
+import hashlib
+import re
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from .cache import (
+    INGREDIENTS,
+    RECIPES,
+    TAGS,
+    author_namespace,
+    fresh_reads,
+    get_versions,
+    recipe_namespace,
+    record,
+)
+from .serializers import RecipeReadSerializer
+from recipes.models import Recipe
+
+MARKER = uuid.uuid4().hex
+FLAG = re.compile(rb'"' + MARKER.encode() + rb'"')
+BOOLEANS = {True: b'true', False: b'false'}
+
+
+def card_namespaces(recipe):
+    """Пространства, от которых зависит карточка рецепта."""
+    return (
+        TAGS,
+        INGREDIENTS,
+        recipe_namespace(recipe.pk),
+        author_namespace(recipe.author_id),
+    )
+
+
+def card_key(recipe_id, versions, base_url):
+    return 'recipe-card:{}:{}'.format(
+        recipe_id,
+        hashlib.md5(f'{versions}{base_url}'.encode()).hexdigest(),
+    )
+
+
+def encode_card(data, renderer):
+    """Карточка рецепта в JSON, разрезанная по флагам пользователя.
+
+    Флаги заменяются маркером, по нему готовые байты делятся на четыре
+    куска: до is_subscribed автора, до is_favorited, до
+    is_in_shopping_cart и остаток.
+    """
+    data['author']['is_subscribed'] = MARKER
+    data['is_favorited'] = MARKER
+    data['is_in_shopping_cart'] = MARKER
+    return tuple(FLAG.split(renderer.render(data)))
+
+
+def render_cards(recipes, request):
+    """JSON карточек рецептов с флагами текущего пользователя.
+
+    Рецепты должны быть загружены с with_flags. Общая для всех
+    пользователей часть карточки берется из кеша, ключ включает версии
+    самого рецепта, его автора, тегов и ингредиентов, поэтому изменение
+    одного рецепта сбрасывает только его карточку. Промахи
+    сериализуются одним набором запросов.
+    """
+    namespaces = {recipe.pk: card_namespaces(recipe) for recipe in recipes}
+    unique = list(dict.fromkeys(
+        namespace for group in namespaces.values() for namespace in group
+    ))
+    versions = dict(zip(unique, get_versions(unique)))
+    base_url = request.build_absolute_uri('/')
+    keys = {
+        pk: card_key(
+            pk, [versions[namespace] for namespace in group], base_url
+        )
+        for pk, group in namespaces.items()
+    }
+    cards = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in cards]
+    if missing:
+        record('card_miss', RECIPES)
+        fresh = {}
+        serializer = RecipeReadSerializer(
+            Recipe.objects.with_user_data(request.user).filter(
+                pk__in=missing
+            ),
+            many=True,
+            context={'request': request},
+        )
+        with fresh_reads([
+            versions[namespace]
+            for pk in missing for namespace in namespaces[pk]
+        ]):
+            for data in serializer.data:
+                fresh[keys[data['id']]] = encode_card(
+                    data, request.accepted_renderer
+                )
+        cache.set_many(fresh, settings.API_CACHE_TIMEOUT)
+        cards.update(fresh)
+    else:
+        record('card_hit', RECIPES)
+    result = []
+    for recipe in recipes:
+        if keys[recipe.pk] not in cards:
+            continue
+        start, favorited, cart, end = cards[keys[recipe.pk]]
+        result.append(b''.join((
+            start,
+            BOOLEANS[bool(recipe.is_author_subscribed)],
+            favorited,
+            BOOLEANS[bool(recipe.is_favorited)],
+            cart,
+            BOOLEANS[bool(recipe.is_in_shopping_cart)],
+            end,
+        )))
+    return result
+
+
+def cards_response(paginator, recipes, request):
+    """Страница рецептов, собранная из готовых байтов карточек."""
+    envelope = request.accepted_renderer.render(
+        paginator.get_paginated_response([]).data
+    )
+    if not envelope.endswith(b'[]}'):
+        raise ValueError('results должен быть последним ключом ответа.')
+    content = b''.join((
+        envelope[:-2],
+        b','.join(render_cards(recipes, request)),
+        b']}',
+    ))
+    return HttpResponse(
+        content,
+        content_type='application/json',
+    )
@@ -1,9 +1,16 @@
 import base64
+import binascii
+from tempfile import SpooledTemporaryFile
 
 import webcolors
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files import File
+from PIL import Image
 from rest_framework import serializers
 
+BASE64_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
+
 
 class Hex2NameColor(serializers.Field):
     """Сериализатор цвета тегов."""
@@ -19,11 +26,59 @@ class Hex2NameColor(serializers.Field):
 
 
 class Base64ImageField(serializers.ImageField):
-    """Сериализатор картинок."""
+    """Сериализатор картинок.
+
+    Base64 декодируется частями во временный файл. Размер файла
+    проверяется до декодирования, размеры картинки — по заголовку,
+    до полной загрузки в Pillow.
+    """
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            data = self.decode(imgstr, 'temp.' + ext)
 
         return super().to_internal_value(data)
+
+    def decode(self, imgstr, name):
+        max_size = settings.IMAGE_MAX_UPLOAD_SIZE
+        if len(imgstr) // 4 * 3 > max_size:
+            raise serializers.ValidationError(
+                f'Размер картинки больше {max_size // 1024 // 1024} МБ.'
+            )
+        file = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        try:
+            for chunk in self.base64_chunks(imgstr):
+                file.write(base64.b64decode(chunk))
+            file.seek(0)
+            with Image.open(file) as image:
+                width, height = image.size
+        except (binascii.Error, OSError, Image.DecompressionBombError):
+            file.close()
+            raise serializers.ValidationError('Неверный формат картинки.')
+        max_dimension = settings.IMAGE_MAX_DIMENSION
+        if width > max_dimension or height > max_dimension:
+            file.close()
+            raise serializers.ValidationError(
+                f'Картинка больше {max_dimension}x{max_dimension} пикселей.'
+            )
+        file.seek(0)
+        return File(file, name=name)
+
+    @staticmethod
+    def base64_chunks(imgstr):
+        """Части base64 без пробелов и переносов строк, кратные 4.
+
+        Остаток, не кратный 4, переносится в следующую часть.
+        """
+        rest = ''
+        for start in range(0, len(imgstr), BASE64_CHUNK_SIZE):
+            chunk = rest + ''.join(
+                imgstr[start:start + BASE64_CHUNK_SIZE].split()
+            )
+            end = len(chunk) // 4 * 4
+            rest = chunk[end:]
+            if end:
+                yield chunk[:end]
+        if rest:
+            yield rest
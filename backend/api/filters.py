@@ -1,15 +1,77 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Exists, IntegerField, OuterRef, Value, When
 from django_filters import rest_framework as filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from .cache import TAGS, fresh_reads, get_versions
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.search import search_recipes
 from users.models import User
 
+ORDERINGS = {
+    'new': ('-pub_date', '-id'),
+    'popular': ('-popularity', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+
+
+def tag_ids():
+    """Словарь «слаг -> id» всех тегов из кеша.
+
+    Ключ включает версию пространства TAGS, поэтому словарь
+    перечитывается после любого изменения тегов.
+    """
+    versions = get_versions([TAGS])
+    key = 'tag-ids:{}'.format(versions[0])
+    ids = cache.get(key)
+    if ids is None:
+        with fresh_reads(versions):
+            ids = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, ids, settings.API_CACHE_TIMEOUT)
+    return ids
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_ids()]
+
+
+class TagsFilter(filters.MultipleChoiceFilter):
+    """Рецепты хотя бы с одним из выбранных тегов.
+
+    Отбор делается одним Exists по промежуточной таблице, поэтому рецепт
+    с несколькими подходящими тегами попадает в выдачу один раз, без
+    DISTINCT и соединений с таблицей тегов.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('choices', tag_choices)
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        ids = tag_ids()
+        return qs.filter(Exists(Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'),
+            tag_id__in=[ids[slug] for slug in value if slug in ids],
+        )))
+
 
 class IngredientFilter(filters.FilterSet):
-    """Фильтр ингрердиентов."""
-    name = filters.CharFilter(
-        field_name='name',
-        lookup_expr='istartswith',
-    )
+    """Фильтр ингрердиентов.
+
+    Совпадения по началу названия выдаются раньше совпадений по подстроке.
+    """
+    name = filters.CharFilter(method='get_name')
+
+    def get_name(self, queryset, name, value):
+        return queryset.filter(name__icontains=value).annotate(
+            is_prefix=Case(
+                When(name__istartswith=value, then=Value(0)),
+                default=Value(1),
+                output_field=IntegerField(),
+            )
+        ).order_by('is_prefix', 'name', 'id')
 
     class Meta:
         model = Ingredient
@@ -22,26 +84,51 @@ class RecipeFilter(filters.FilterSet):
         field_name='author_id',
         queryset=User.objects.all()
     )
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-    )
+    tags = TagsFilter()
     is_favorited = filters.BooleanFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart',
     )
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=(
+            ('new', 'Новые'),
+            ('popular', 'Популярные'),
+            ('trending', 'Набирающие популярность'),
+        ),
+        method='get_ordering',
+    )
+
+    def filter_user_list(self, queryset, model, value):
+        """Рецепты из избранного или списка покупок пользователя.
+
+        Значение false фильтр не применяет, у анонима список пуст.
+        """
+        if not value:
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(model.objects.filter(
+            user=user, recipe_id=OuterRef('pk')
+        )))
 
     def get_is_favorited(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorites__user=self.request.user)
-        return Recipe.objects.all()
+        return self.filter_user_list(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_cart__user=self.request.user)
-        return Recipe.objects.all()
+        return self.filter_user_list(queryset, ShoppingCart, value)
+
+    def get_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        """Сортировка по индексу: по дате, popularity или trending_score."""
+        return queryset.order_by(*ORDERINGS[value])
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart',
+            'search', 'ordering',
+        )
@@ -0,0 +1,159 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import (
+    benchmark_user,
+    compare,
+    load_baseline,
+    make_client,
+    run_scenario,
+    save_baseline,
+)
+from recipes.models import Ingredient, Recipe, Tag
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет p50/p95/p99, число запросов к БД и память на запрос '
+        'для основных адресов API. Данные готовит seed_benchmark.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument(
+            '--user',
+            help='Пользователь для авторизованных запросов. По умолчанию '
+                 'тот, у кого больше всего подписок и покупок.',
+        )
+        parser.add_argument(
+            '--only', nargs='+', help='Запустить только эти сценарии.'
+        )
+        parser.add_argument('--save', help='Сохранить результаты в JSON.')
+        parser.add_argument('--compare', help='Сравнить с JSON прогоном.')
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help='Допустимый рост памяти и медианы времени, доля '
+                 '(0.2 — 20%%).',
+        )
+        parser.add_argument(
+            '--noise-ms',
+            type=float,
+            default=1.0,
+            help='Рост медианы времени меньше этого не считается.',
+        )
+        parser.add_argument(
+            '--strict-timing',
+            action='store_true',
+            help='Считать рост времени регрессией, а не предупреждением.',
+        )
+
+    def get_user(self, username):
+        user = benchmark_user(username)
+        if user is None:
+            raise CommandError(
+                f'Нет пользователя {username}.' if username else
+                'Нет пользователей, запустите seed_benchmark.'
+            )
+        return user
+
+    def get_scenarios(self, user):
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        if recipe is None:
+            raise CommandError('Нет рецептов, запустите seed_benchmark.')
+        tags = '&'.join(
+            f'tags={slug}' for slug in Tag.objects.values_list(
+                'slug', flat=True
+            )[:2]
+        )
+        have = ','.join(
+            str(pk) for pk in recipe.ingredients.values_list('id', flat=True)
+        )
+        ingredient = Ingredient.objects.order_by('id').first()
+        prefix = ingredient.name[:3] if ingredient else 'а'
+        return {
+            'recipe_list': ('/api/recipes/', True),
+            'recipe_list_anonymous': ('/api/recipes/', False),
+            'recipe_list_cursor': ('/api/recipes/?cursor=', True),
+            'recipe_filter': (
+                f'/api/recipes/?{tags}&is_favorited=1', True
+            ),
+            'recipe_detail': (f'/api/recipes/{recipe.pk}/', True),
+            'recipe_detail_anonymous': (f'/api/recipes/{recipe.pk}/', False),
+            'feed': ('/api/recipes/feed/', True),
+            'subscriptions': (
+                '/api/users/subscriptions/?recipes_limit=3', True
+            ),
+            'shopping_cart': ('/api/recipes/download_shopping_cart/', True),
+            'ingredient_search': (f'/api/ingredients/?name={prefix}', False),
+            'what_to_cook': (
+                f'/api/recipes/what_to_cook/?ingredients={have}', True
+            ),
+        }
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['user'])
+        token, _ = Token.objects.get_or_create(user=user)
+        clients = {True: make_client(token.key), False: make_client()}
+        scenarios = self.get_scenarios(user)
+        if options['only']:
+            unknown = set(options['only']) - set(scenarios)
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные сценарии: {", ".join(sorted(unknown))}'
+                )
+            scenarios = {
+                name: scenarios[name] for name in options['only']
+            }
+        results = {}
+        self.stdout.write(
+            f'{"сценарий":<26}{"p50":>9}{"p95":>9}{"p99":>9}'
+            f'{"SQL":>5}{"КБ":>9}{"пик КБ":>9}'
+        )
+        for name, (path, authorized) in scenarios.items():
+            try:
+                result = run_scenario(
+                    clients[authorized],
+                    path,
+                    options['iterations'],
+                    options['warmup'],
+                )
+            except RuntimeError as error:
+                raise CommandError(str(error))
+            results[name] = result
+            self.stdout.write(
+                f'{name:<26}{result["p50_ms"]:>9.2f}{result["p95_ms"]:>9.2f}'
+                f'{result["p99_ms"]:>9.2f}{result["queries"]:>5}'
+                f'{result["alloc_kb"]:>9.1f}{result["peak_kb"]:>9.1f}'
+            )
+        if options['save']:
+            save_baseline(
+                options['save'],
+                results,
+                user=user.username,
+                iterations=options['iterations'],
+                recipes=Recipe.objects.count(),
+            )
+            self.stdout.write(f'Результаты сохранены в {options["save"]}')
+        if options['compare']:
+            regressions, warnings = compare(
+                results,
+                load_baseline(options['compare']),
+                options['tolerance'],
+                options['noise_ms'],
+            )
+            if options['strict_timing']:
+                regressions += warnings
+            elif warnings:
+                self.stdout.write(self.style.WARNING(
+                    'Время выросло (не считается регрессией):\n'
+                    + '\n'.join(warnings)
+                ))
+            if regressions:
+                raise CommandError(
+                    'Регрессии производительности:\n'
+                    + '\n'.join(regressions)
+                )
+            self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
@@ -0,0 +1,201 @@
+import http.client
+import os
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from api.benchmarks import LatencyProxy, benchmark_user, percentile
+from recipes.models import Ingredient, Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Запускает gunicorn в режимах WSGI и ASGI и сравнивает пропускную '
+        'способность и задержки под параллельной нагрузкой на адреса '
+        'списка и страницы рецепта, поиска ингредиентов и списка '
+        'покупок. Сервер работает с базой из настроек окружения, '
+        'данные готовит seed_benchmark.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--modes', nargs='+', choices=('wsgi', 'asgi'),
+            default=['wsgi', 'asgi'],
+        )
+        parser.add_argument(
+            '--concurrency', type=int, nargs='+', default=[1, 16, 64],
+            help='Число одновременных клиентов.',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=5,
+            help='Длительность замера для каждого числа клиентов, секунды.',
+        )
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--threads', type=int, default=1,
+            help='Потоков на процесс в режиме WSGI.',
+        )
+        parser.add_argument('--port', type=int, default=8150)
+        parser.add_argument('--user')
+        parser.add_argument(
+            '--db-latency-ms', type=float, default=0,
+            help='Задержка каждой посылки к Postgres через прокси, '
+                 'как у базы на другой машине.',
+        )
+
+    def get_paths(self):
+        recipe = Recipe.objects.order_by('-favorites_count', 'id').first()
+        if recipe is None:
+            raise CommandError('Нет рецептов, запустите seed_benchmark.')
+        ingredient = Ingredient.objects.order_by('id').first()
+        prefix = ingredient.name[:3] if ingredient else 'а'
+        return [
+            '/api/recipes/',
+            f'/api/recipes/{recipe.pk}/',
+            f'/api/ingredients/?name={quote(prefix)}',
+            '/api/recipes/download_shopping_cart/',
+        ]
+
+    def start_server(self, mode, options, **extra_env):
+        env = dict(
+            os.environ,
+            ASGI_ENABLED=str(mode == 'asgi'),
+            GUNICORN_BIND=f'127.0.0.1:{options["port"]}',
+            WEB_CONCURRENCY=str(options['workers']),
+            GUNICORN_THREADS=str(options['threads']),
+            **extra_env,
+        )
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                '-c', 'gunicorn.conf.py', '--log-level', 'warning',
+            ],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(
+                    f'{mode}: gunicorn завершился, проверьте запуск '
+                    f'gunicorn -c gunicorn.conf.py вручную.'
+                )
+            try:
+                connection = http.client.HTTPConnection(
+                    '127.0.0.1', options['port'], timeout=1
+                )
+                connection.request(
+                    'GET', '/api/tags/', headers={'Host': 'localhost'}
+                )
+                connection.getresponse().read()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'{mode}: сервер не ответил за 30 секунд.')
+
+    def load(self, port, paths, headers, clients, duration):
+        """Нагрузка clients потоками с постоянными соединениями."""
+        timings = []
+        errors = []
+        deadline = time.monotonic() + duration
+
+        def client(offset):
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            number = offset
+            while time.monotonic() < deadline:
+                path = paths[number % len(paths)]
+                number += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                except OSError:
+                    errors.append(path)
+                    connection.close()
+                    continue
+                timings.append((time.perf_counter() - started) * 1000)
+                if response.status != 200:
+                    errors.append(path)
+            connection.close()
+
+        threads = [
+            threading.Thread(target=client, args=(offset,))
+            for offset in range(clients)
+        ]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return timings, len(errors), time.monotonic() - started
+
+    def handle(self, *args, **options):
+        user = benchmark_user(options['user'])
+        if user is None:
+            raise CommandError('Нет пользователей, запустите seed_benchmark.')
+        token, _ = Token.objects.get_or_create(user=user)
+        headers = {
+            'Host': 'localhost',
+            'Authorization': f'Token {token.key}',
+        }
+        paths = self.get_paths()
+        extra_env = {}
+        proxy = None
+        if options['db_latency_ms']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('Задержка базы работает только с Postgres.')
+            database = connection.settings_dict
+            proxy = LatencyProxy(
+                database['HOST'] or 'localhost',
+                database['PORT'],
+                options['db_latency_ms'] / 1000,
+            )
+            extra_env = {
+                'DB_HOST': '127.0.0.1', 'DB_PORT': str(proxy.start()),
+            }
+        try:
+            self.run_modes(paths, headers, options, extra_env)
+        finally:
+            if proxy is not None:
+                proxy.stop()
+
+    def run_modes(self, paths, headers, options, extra_env):
+        self.stdout.write(
+            f'{"режим":<7}{"клиентов":>9}{"запр/с":>10}{"p50":>9}'
+            f'{"p95":>9}{"p99":>9}{"ошибок":>8}'
+        )
+        for mode in options['modes']:
+            server = self.start_server(mode, options, **extra_env)
+            try:
+                self.load(options['port'], paths, headers, 1, 1)
+                for clients in options['concurrency']:
+                    timings, errors, elapsed = self.load(
+                        options['port'],
+                        paths,
+                        headers,
+                        clients,
+                        options['duration'],
+                    )
+                    if not timings:
+                        raise CommandError(f'{mode}: нет ответов.')
+                    self.stdout.write(
+                        f'{mode:<7}{clients:>9}'
+                        f'{len(timings) / elapsed:>10.1f}'
+                        f'{percentile(timings, 50):>9.1f}'
+                        f'{percentile(timings, 95):>9.1f}'
+                        f'{percentile(timings, 99):>9.1f}{errors:>8}'
+                    )
+            finally:
+                server.terminate()
+                server.wait()
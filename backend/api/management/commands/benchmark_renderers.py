@@ -0,0 +1,101 @@
+import io
+import time
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import percentile
+from api.parsers import FastJSONParser
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeReadSerializer
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает JSONRenderer/JSONParser из DRF с FastJSONRenderer/'
+        'FastJSONParser на страницах списка рецептов. Данные готовит '
+        'seed_benchmark.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[6, 50, 200],
+            help='Число рецептов на странице.',
+        )
+        parser.add_argument('--iterations', type=int, default=200)
+
+    def payload(self, size):
+        request = Request(APIRequestFactory().get(
+            '/api/recipes/', HTTP_HOST='localhost'
+        ))
+        request.user = AnonymousUser()
+        recipes = Recipe.objects.with_user_data(request.user)[:size]
+        return {
+            'count': size,
+            'next': None,
+            'previous': None,
+            'results': RecipeReadSerializer(
+                recipes, many=True, context={'request': request}
+            ).data,
+        }
+
+    def measure(self, function, iterations):
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        return percentile(timings, 50)
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            self.stdout.write(self.style.WARNING(
+                'orjson не установлен, сравнивается json с самим собой.'
+            ))
+        if not Recipe.objects.exists():
+            raise CommandError('Нет рецептов, запустите seed_benchmark.')
+        iterations = options['iterations']
+        self.stdout.write(
+            f'{"рецептов":>9}{"КБ":>9}{"render":>10}{"fast":>10}{"x":>7}'
+            f'{"parse":>10}{"fast":>10}{"x":>7}'
+        )
+        for size in options['sizes']:
+            data = self.payload(size)
+            body = JSONRenderer().render(data)
+            if FastJSONRenderer().render(data) != body:
+                raise CommandError(
+                    f'{size}: FastJSONRenderer отдает другие байты.'
+                )
+            if FastJSONParser().parse(io.BytesIO(body)) != (
+                JSONParser().parse(io.BytesIO(body))
+            ):
+                raise CommandError(
+                    f'{size}: FastJSONParser читает данные иначе.'
+                )
+            render, fast_render = (
+                self.measure(
+                    lambda: renderer.render(data), iterations
+                )
+                for renderer in (JSONRenderer(), FastJSONRenderer())
+            )
+            parse, fast_parse = (
+                self.measure(
+                    lambda: parser.parse(io.BytesIO(body)), iterations
+                )
+                for parser in (JSONParser(), FastJSONParser())
+            )
+            self.stdout.write(
+                f'{len(data["results"]):>9}{len(body) / 1024:>9.1f}'
+                f'{render:>10.3f}{fast_render:>10.3f}'
+                f'{render / fast_render:>7.1f}'
+                f'{parse:>10.3f}{fast_parse:>10.3f}'
+                f'{parse / fast_parse:>7.1f}'
+            )
@@ -0,0 +1,160 @@
+import json
+import re
+from collections import defaultdict
+from itertools import product
+from types import SimpleNamespace
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+
+from api.filters import RecipeFilter
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag
+
+SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING)')
+
+
+class Command(BaseCommand):
+    help = (
+        'Строит планы запросов для всех сочетаний фильтров рецептов. '
+        'Завершается с ошибкой при последовательном чтении больших '
+        'таблиц, при повторяющихся рецептах в выдаче и при расхождении '
+        'выдачи с отбором, посчитанным без базы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='Таблицы меньшего размера можно читать целиком.',
+        )
+        parser.add_argument('--page-size', type=int, default=6)
+
+    def handle(self, *args, **options):
+        favorite = Favorite.objects.select_related('user').first()
+        tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+        if favorite is None or not tags:
+            raise CommandError(
+                'Нужны теги и хотя бы один рецепт в избранном '
+                '(можно создать командой seed_benchmark).'
+            )
+        user = favorite.user
+        recipe = Recipe.objects.filter(author__isnull=False).first()
+        variants = {
+            'author': [[str(recipe.author_id)]],
+            'tags': [tags[:1], tags],
+            'is_favorited': [['1'], ['0']],
+            'is_in_shopping_cart': [['1'], ['0']],
+            'ordering': [['popular'], ['trending']],
+        }
+        reference = self.reference(user)
+        sizes = self.table_sizes()
+        failures = []
+        for current in (user, AnonymousUser()):
+            for values in product(
+                *([None, *choices] for choices in variants.values())
+            ):
+                data = QueryDict(mutable=True)
+                for name, value in zip(variants, values):
+                    if value is not None:
+                        data.setlist(name, value)
+                label = '{} ({})'.format(
+                    data.urlencode() or 'без фильтров',
+                    current.username or 'аноним',
+                )
+                failures.extend(
+                    f'{label}: {problem}'
+                    for problem in self.check_filters(
+                        data, current, reference, sizes, options
+                    )
+                )
+        for failure in failures:
+            self.stderr.write(failure)
+        if failures:
+            raise CommandError(f'Найдено проблем: {len(failures)}')
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке.'))
+
+    def reference(self, user):
+        """Данные для отбора рецептов без фильтров базы."""
+        tags = defaultdict(set)
+        for recipe_id, slug in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag__slug'
+        ):
+            tags[recipe_id].add(slug)
+        return {
+            'authors': dict(Recipe.objects.values_list('id', 'author_id')),
+            'tags': tags,
+            'is_favorited': set(Favorite.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)),
+            'is_in_shopping_cart': set(ShoppingCart.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)),
+        }
+
+    def expected_ids(self, data, user, reference):
+        ids = set(reference['authors'])
+        if 'author' in data:
+            ids = {
+                pk for pk in ids
+                if str(reference['authors'][pk]) == data['author']
+            }
+        if 'tags' in data:
+            slugs = set(data.getlist('tags'))
+            ids = {pk for pk in ids if reference['tags'][pk] & slugs}
+        for name in ('is_favorited', 'is_in_shopping_cart'):
+            if data.get(name) == '1':
+                ids &= reference[name] if user.is_authenticated else set()
+        return ids
+
+    def check_filters(self, data, user, reference, sizes, options):
+        queryset = RecipeFilter(
+            data=data,
+            queryset=Recipe.objects.with_user_data(user),
+            request=SimpleNamespace(user=user),
+        ).qs
+        ids = list(queryset.values_list('id', flat=True))
+        if len(ids) != len(set(ids)):
+            yield f'повторяющиеся рецепты ({len(ids) - len(set(ids))})'
+        expected = self.expected_ids(data, user, reference)
+        if set(ids) != expected:
+            yield (
+                f'выдача расходится с ожидаемой: '
+                f'лишних {len(set(ids) - expected)}, '
+                f'не хватает {len(expected - set(ids))}'
+            )
+        if queryset.query.is_empty():
+            return
+        page = queryset[:options['page_size']]
+        for table in self.scanned_tables(page):
+            if sizes.get(table, 0) >= options['min_rows']:
+                yield f'последовательное чтение {table} ({sizes[table]} строк)'
+
+    def scanned_tables(self, queryset):
+        if connection.vendor == 'postgresql':
+            sql, params = queryset.query.sql_with_params()
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return set(self.postgres_seq_scans(plan[0]['Plan']))
+        return set(SQLITE_SCAN.findall(queryset.explain()))
+
+    def postgres_seq_scans(self, node):
+        if node['Node Type'] == 'Seq Scan':
+            yield node['Relation Name']
+        for child in node.get('Plans', ()):
+            yield from self.postgres_seq_scans(child)
+
+    def table_sizes(self):
+        sizes = {}
+        with connection.cursor() as cursor:
+            for table in connection.introspection.table_names(cursor):
+                cursor.execute(
+                    f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+                )
+                sizes[table] = cursor.fetchone()[0]
+        return sizes
@@ -0,0 +1,207 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes import feed
+from recipes.counters import recount_all
+from recipes.loaders import load_ingredients, read_ingredients
+from recipes.models import (
+    Favorite,
+    Ingredient,
+    IngredientRecipe,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.ranking import recompute_popularity, recompute_trending
+from users.models import Follow, User
+
+PREFIX = 'bench_'
+BATCH_SIZE = 1000
+TAGS = (
+    ('завтрак', '#FFFC66', 'breakfast'),
+    ('обед', '#54E709', 'lunch'),
+    ('ужин', '#8775D2', 'dinner'),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Создает пользователей, рецепты, подписки, избранное и корзины '
+        'для нагрузочного тестирования. Популярность авторов и рецептов '
+        'распределена по степенному закону.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument(
+            '--clear',
+            action='store_true',
+            help='Удалить ранее созданные тестовые данные.',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        if options['clear']:
+            deleted, _ = User.objects.filter(
+                username__startswith=PREFIX
+            ).delete()
+            self.stdout.write(f'Удалено объектов: {deleted}')
+        if not Ingredient.objects.exists():
+            load_ingredients(read_ingredients(
+                settings.BASE_DIR / 'data' / 'ingredients.csv'
+            ))
+        with transaction.atomic():
+            tags = self.create_tags()
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(users, tags, options['recipes'])
+            self.create_relations(users, recipes)
+        recount_all()
+        recompute_popularity()
+        recompute_trending()
+        feed.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано пользователей: {len(users)}, рецептов: {len(recipes)}'
+        ))
+
+    def weighted(self, items, count, alpha=1.2):
+        """Выборка без повторов с весами по закону Ципфа."""
+        count = min(count, len(items))
+        weights = [1 / (rank + 1) ** alpha for rank in range(len(items))]
+        chosen = set()
+        while len(chosen) < count:
+            chosen.update(self.random.choices(
+                range(len(items)), weights, k=count - len(chosen)
+            ))
+        return [items[index] for index in chosen]
+
+    def create_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.all())
+
+    def create_users(self, count):
+        start = User.objects.filter(username__startswith=PREFIX).count()
+        password = make_password(None)
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f'{PREFIX}{number}',
+                    email=f'{PREFIX}{number}@example.com',
+                    first_name='Тест',
+                    last_name=f'Пользователь {number}',
+                    password=password,
+                )
+                for number in range(start, start + count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        return list(
+            User.objects.filter(username__startswith=PREFIX).order_by('id')
+        )
+
+    def create_image(self):
+        buffer = BytesIO()
+        Image.new('RGB', (64, 64), '#FFAA00').save(buffer, 'PNG')
+        name = 'recipes/images/benchmark.png'
+        if not default_storage.exists(name):
+            default_storage.save(name, ContentFile(buffer.getvalue()))
+        return name
+
+    def create_recipes(self, users, tags, count):
+        image = self.create_image()
+        authors = self.weighted(users, len(users))
+        weights = [1 / (rank + 1) for rank in range(len(authors))]
+        now = timezone.now()
+        recipes = Recipe.objects.bulk_create(
+            [
+                Recipe(
+                    author=self.random.choices(authors, weights)[0],
+                    name=f'Рецепт {number}',
+                    text='Описание рецепта. ' * self.random.randint(1, 20),
+                    cooking_time=self.random.randint(5, 180),
+                    image=image,
+                )
+                for number in range(count)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        if not recipes or recipes[0].pk is None:
+            recipes = list(Recipe.objects.filter(
+                author__username__startswith=PREFIX
+            ).order_by('-id')[:count])
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                minutes=self.random.randint(0, 60 * 24 * 365)
+            )
+        Recipe.objects.bulk_update(recipes, ['pub_date'], BATCH_SIZE)
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        Recipe.tags.through.objects.bulk_create(
+            [
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+                for recipe in recipes
+                for tag in self.random.sample(
+                    tags, self.random.randint(1, len(tags))
+                )
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        IngredientRecipe.objects.bulk_create(
+            [
+                IngredientRecipe(
+                    recipe_id=recipe.pk,
+                    ingredient_id=ingredient_id,
+                    amount=self.random.randint(1, 500),
+                )
+                for recipe in recipes
+                for ingredient_id in self.random.sample(
+                    ingredient_ids, self.random.randint(3, 12)
+                )
+            ],
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+        return recipes
+
+    def create_relations(self, users, recipes):
+        popular_recipes = self.weighted(recipes, len(recipes))
+        authors = list({recipe.author_id for recipe in recipes})
+        follows, favorites, carts = [], [], []
+        for user in users:
+            for author_id in self.random.sample(
+                authors, min(len(authors), self.random.randint(0, 30))
+            ):
+                if author_id != user.pk:
+                    follows.append(Follow(user=user, author_id=author_id))
+            favorites.extend(
+                Favorite(user=user, recipe=recipe)
+                for recipe in self.weighted(
+                    popular_recipes, self.random.randint(0, 50)
+                )
+            )
+            carts.extend(
+                ShoppingCart(user=user, recipe=recipe)
+                for recipe in self.weighted(
+                    popular_recipes, self.random.randint(0, 10)
+                )
+            )
+        for model, objects in (
+            (Follow, follows), (Favorite, favorites), (ShoppingCart, carts)
+        ):
+            model.objects.bulk_create(
+                objects, batch_size=BATCH_SIZE, ignore_conflicts=True
+            )
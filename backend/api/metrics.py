@@ -0,0 +1,178 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from foodgram_backend.db import pool
+
+from .cache import get_stats
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+current_metrics = ContextVar('request_metrics', default=None)
+
+STRING = re.compile(r"'(?:[^']|'')*'")
+NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+IN_LIST = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+SPACES = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL без значений: запросы, различающиеся только ими, совпадут."""
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    sql = IN_LIST.sub('IN (...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    """Замеры одного запроса."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0
+        self.serializer_time = 0
+        self.view_started = None
+        self.view_finished = None
+        self.fingerprints = Counter()
+        self.serializing = False
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self, threshold, limit=5):
+        return [
+            {'sql': sql, 'count': count}
+            for sql, count in self.fingerprints.most_common(limit)
+            if count >= threshold
+        ]
+
+
+class SerializerTimingMixin:
+    """Засекает время сериализации верхнего уровня.
+
+    Вложенные сериализаторы с этой примесью не считаются повторно.
+    """
+    def to_representation(self, instance):
+        metrics = current_metrics.get()
+        if metrics is None or metrics.serializing:
+            return super().to_representation(instance)
+        metrics.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializing = False
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            yield f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+        yield f'{name}_sum{{{labels}}} {self.sum}'
+        yield f'{name}_count{{{labels}}} {self.count}'
+
+
+class Registry:
+    """Гистограммы по маршрутам, накопленные в этом процессе."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = defaultdict(lambda: Histogram(DURATION_BUCKETS))
+        self.queries = defaultdict(lambda: Histogram(QUERY_BUCKETS))
+        self.db_time = Counter()
+
+    def observe(self, route, method, status, metrics, duration):
+        with self.lock:
+            self.durations[route, method, status].observe(duration)
+            self.queries[route, method].observe(metrics.queries)
+            self.db_time[route, method] += metrics.db_time
+
+    def render(self):
+        lines = [
+            '# HELP foodgram_request_duration_seconds Время ответа.',
+            '# TYPE foodgram_request_duration_seconds histogram',
+        ]
+        with self.lock:
+            for (route, method, status), histogram in sorted(
+                self.durations.items()
+            ):
+                lines.extend(histogram.lines(
+                    'foodgram_request_duration_seconds',
+                    f'route="{route}",method="{method}",status="{status}"',
+                ))
+            lines += [
+                '# HELP foodgram_request_db_queries Запросов к БД на ответ.',
+                '# TYPE foodgram_request_db_queries histogram',
+            ]
+            for (route, method), histogram in sorted(self.queries.items()):
+                lines.extend(histogram.lines(
+                    'foodgram_request_db_queries',
+                    f'route="{route}",method="{method}"',
+                ))
+            lines += [
+                '# HELP foodgram_request_db_seconds_total Время в БД.',
+                '# TYPE foodgram_request_db_seconds_total counter',
+            ]
+            lines.extend(
+                f'foodgram_request_db_seconds_total{{route="{route}",'
+                f'method="{method}"}} {seconds}'
+                for (route, method), seconds in sorted(self.db_time.items())
+            )
+        lines += [
+            '# HELP foodgram_api_cache_events_total События кеша ответов.',
+            '# TYPE foodgram_api_cache_events_total counter',
+        ]
+        lines.extend(
+            f'foodgram_api_cache_events_total{{namespace="{namespace}",'
+            f'event="{event}"}} {count}'
+            for (event, namespace), count in sorted(get_stats().items())
+        )
+        lines += [
+            '# HELP foodgram_db_connection_events_total Соединения с БД: '
+            'открыто, получено, взято из пула, ожидания и отказы пула.',
+            '# TYPE foodgram_db_connection_events_total counter',
+        ]
+        lines.extend(
+            f'foodgram_db_connection_events_total{{event="{event}"}} {count}'
+            for event, count in sorted(pool.get_stats().items())
+        )
+        lines += [
+            '# HELP foodgram_db_pool_connections Соединения в пуле.',
+            '# TYPE foodgram_db_pool_connections gauge',
+        ]
+        for alias, (idle, in_use) in sorted(pool.pool_sizes().items()):
+            lines += [
+                f'foodgram_db_pool_connections{{alias="{alias}",'
+                f'state="idle"}} {idle}',
+                f'foodgram_db_pool_connections{{alias="{alias}",'
+                f'state="in_use"}} {in_use}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
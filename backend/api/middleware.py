@@ -0,0 +1,87 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .metrics import RequestMetrics, current_metrics, registry
+
+logger = logging.getLogger('api.metrics')
+
+
+class MetricsMiddleware:
+    """Замеры запросов к API.
+
+    Считает запросы к БД и их время через execute_wrapper, время
+    вьюхи, сериализации и рендера и отдает их в заголовке
+    Server-Timing. Медленные запросы и запросы с повторяющимся SQL
+    (N+1) пишутся в лог. Запросы к БД из потокового ответа после
+    возврата из вьюхи не учитываются.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        metrics = RequestMetrics()
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        finished = time.perf_counter()
+        duration = finished - metrics.started
+        route = (
+            request.resolver_match.view_name
+            if request.resolver_match else 'unmatched'
+        )
+        registry.observe(
+            route, request.method, response.status_code, metrics, duration
+        )
+        timings = self.get_timings(metrics, finished)
+        response['Server-Timing'] = ', '.join(
+            [f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries}"']
+            + [f'{name};dur={value * 1000:.1f}' for name, value in timings]
+            + [f'total;dur={duration * 1000:.1f}']
+        )
+        repeated = metrics.repeated(settings.METRICS_REPEATED_QUERIES)
+        if duration * 1000 >= settings.METRICS_SLOW_REQUEST_MS or repeated:
+            logger.warning(json.dumps({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'route': route,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 1),
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 1),
+                'serializer_ms': round(metrics.serializer_time * 1000, 1),
+                'repeated_queries': repeated,
+            }, ensure_ascii=False))
+        return response
+
+    def get_timings(self, metrics, finished):
+        if metrics.view_started is None:
+            return []
+        view_finished = metrics.view_finished or finished
+        return [
+            ('view', view_finished - metrics.view_started),
+            ('serializer', metrics.serializer_time),
+            ('render', finished - view_finished),
+        ]
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.view_finished = time.perf_counter()
+        return response
@@ -1,7 +1,282 @@
+import bisect
+import hashlib
+import heapq
+import math
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict, namedtuple
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+FeedItem = namedtuple('FeedItem', ('pub_date', 'pk'))
 
 
 class CustomPagination(PageNumberPagination):
     """Кастомный пагинатор."""
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class RecipePagination(CustomPagination):
+    """Пагинатор рецептов.
+
+    Без параметра cursor работает постранично. С ним (первая страница
+    запрашивается с пустым cursor) переходит на пагинацию по ключу
+    (pub_date, id) или, при сортировке по убыванию popularity или
+    trending_score, по ним: следующая страница выбирается условием по
+    ключу вместо OFFSET, а count берется из оценки или кеша. Результаты
+    поиска идут по (rank, id).
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    count_cache_timeout = 60
+    key_field = 'pub_date'
+    score_fields = ('popularity', 'trending_score', 'rank')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if getattr(queryset, 'search_ranks', None) is not None:
+            return self.paginate_ranked(queryset, request, view)
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.page_query_param
+        )
+        page_size = self.get_page_size(request)
+        self.key_field = self.get_key_field(queryset)
+        direction, position = self.decode_cursor(
+            request.query_params[self.cursor_query_param]
+        )
+        self.count = self.get_count(queryset)
+        if direction == 'previous':
+            page = list(
+                self.filter_before(queryset, position)
+                .order_by(self.key_field, 'id')[:page_size + 1]
+            )
+            self.has_previous = len(page) > page_size
+            self.has_next = True
+            page = page[:page_size][::-1]
+        else:
+            if position is not None:
+                queryset = self.filter_after(queryset, position)
+            page = list(
+                queryset.order_by(f'-{self.key_field}', '-id')
+                [:page_size + 1]
+            )
+            self.has_next = len(page) > page_size
+            self.has_previous = position is not None
+            page = page[:page_size]
+        self.page = page
+        return page
+
+    def paginate_ranked(self, queryset, request, view=None):
+        """Результаты поиска без Postgres, отсортированные в памяти.
+
+        Совпадений не больше RECIPE_SEARCH_MAX_RESULTS, поэтому их id
+        сортируются по (rank, id) в Python, а из базы загружаются только
+        рецепты страницы.
+        """
+        ranks = queryset.search_ranks
+
+        def order(pk):
+            return -ranks[pk], -pk
+
+        ids = sorted(queryset.values_list('pk', flat=True), key=order)
+        if not self.cursor_mode:
+            ids = super().paginate_queryset(ids, request, view)
+        else:
+            self.request = request
+            self.base_url = remove_query_param(
+                request.build_absolute_uri(), self.page_query_param
+            )
+            page_size = self.get_page_size(request)
+            self.key_field = 'rank'
+            direction, position = self.decode_cursor(
+                request.query_params[self.cursor_query_param]
+            )
+            self.count = len(ids)
+            keys = [order(pk) for pk in ids]
+            if direction == 'previous':
+                end = bisect.bisect_left(
+                    keys, (-position[0], -position[1])
+                )
+                start = max(end - page_size, 0)
+                self.has_previous = start > 0
+                self.has_next = True
+            else:
+                start = 0 if position is None else bisect.bisect_right(
+                    keys, (-position[0], -position[1])
+                )
+                end = start + page_size
+                self.has_next = end < len(ids)
+                self.has_previous = position is not None
+            ids = ids[start:end]
+        recipes = queryset.in_bulk(ids)
+        page = [recipes[pk] for pk in ids]
+        for recipe in page:
+            recipe.rank = ranks[recipe.pk]
+        if self.cursor_mode:
+            self.page = page
+        return page
+
+    def get_key_field(self, queryset):
+        """Поле ключа: score_fields, если queryset отсортирован по нему."""
+        order_by = queryset.query.order_by
+        fields = {f'-{field}': field for field in self.score_fields}
+        if len(order_by) == 2 and order_by[1] == '-id':
+            return fields.get(order_by[0], 'pub_date')
+        return 'pub_date'
+
+    def filter_after(self, queryset, position, pk_field='pk'):
+        key, pk = position
+        return queryset.filter(
+            Q(**{f'{self.key_field}__lt': key})
+            | Q(**{self.key_field: key, f'{pk_field}__lt': pk})
+        )
+
+    def filter_before(self, queryset, position, pk_field='pk'):
+        key, pk = position
+        return queryset.filter(
+            Q(**{f'{self.key_field}__gt': key})
+            | Q(**{self.key_field: key, f'{pk_field}__gt': pk})
+        )
+
+    def encode_cursor(self, direction, recipe):
+        key = getattr(recipe, self.key_field)
+        key = key.isoformat() if self.key_field == 'pub_date' else repr(key)
+        token = f'{direction}|{key}|{recipe.pk}'
+        return urlsafe_b64encode(token.encode()).decode()
+
+    def decode_cursor(self, token):
+        if not token:
+            return 'next', None
+        try:
+            direction, key, pk = (
+                urlsafe_b64decode(token.encode()).decode().split('|')
+            )
+            if self.key_field == 'pub_date':
+                key = parse_datetime(key)
+            else:
+                key = float(key)
+                if not math.isfinite(key):
+                    key = None
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if key is None or direction not in ('next', 'previous'):
+            raise NotFound(self.invalid_cursor_message)
+        return direction, (key, pk)
+
+    def get_count(self, queryset):
+        """Оценка для таблицы без фильтров, кеш для остальных запросов."""
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE relname = %s',
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return row[0]
+        sql, params = queryset.query.sql_with_params()
+        key = 'recipe-count:' + hashlib.md5(
+            f'{sql}{params}'.encode()
+        ).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = queryset.count()
+            cache.set(key, count, self.count_cache_timeout)
+        return count
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if not self.has_next or not self.page:
+            return None
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.encode_cursor('next', self.page[-1]),
+        )
+
+    def get_previous_link(self):
+        if not self.cursor_mode:
+            return super().get_previous_link()
+        if not self.has_previous or not self.page:
+            return None
+        return replace_query_param(
+            self.base_url,
+            self.cursor_query_param,
+            self.encode_cursor('previous', self.page[0]),
+        )
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+
+class FeedPagination(RecipePagination):
+    """Пагинатор ленты подписок.
+
+    Всегда работает по ключу (pub_date, id рецепта). Принимает список
+    источников (queryset, поле id рецепта): из каждого берется не больше
+    страницы, отсортированные куски сливаются. Возвращает FeedItem,
+    рецепты по ним загружает вьюха.
+    """
+
+    def paginate_queryset(self, sources, request, view=None):
+        self.cursor_mode = True
+        self.request = request
+        self.base_url = remove_query_param(
+            request.build_absolute_uri(), self.page_query_param
+        )
+        page_size = self.get_page_size(request)
+        direction, position = self.decode_cursor(
+            request.query_params.get(self.cursor_query_param, '')
+        )
+        self.count = sum(self.get_count(queryset) for queryset, _ in sources)
+        forward = direction == 'next'
+        chunks = []
+        for queryset, pk_field in sources:
+            if position is not None:
+                queryset = (
+                    self.filter_after if forward else self.filter_before
+                )(queryset, position, pk_field)
+            order = ('-pub_date', f'-{pk_field}') if forward else (
+                'pub_date', pk_field
+            )
+            chunks.append(
+                queryset.order_by(*order)
+                .values_list('pub_date', pk_field)[:page_size + 1]
+            )
+        page, seen = [], set()
+        for pub_date, pk in heapq.merge(*chunks, reverse=forward):
+            if pk not in seen:
+                seen.add(pk)
+                page.append(FeedItem(pub_date, pk))
+            if len(page) > page_size:
+                break
+        if forward:
+            self.has_next = len(page) > page_size
+            self.has_previous = position is not None
+            page = page[:page_size]
+        else:
+            self.has_previous = len(page) > page_size
+            self.has_next = True
+            page = page[:page_size][::-1]
+        self.page = page
+        return page
@@ -0,0 +1,136 @@
+import csv
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+    if orjson else 0
+)
+
+
+class Echo:
+    """Буфер, который отдает записанную строку вместо хранения."""
+
+    def write(self, value):
+        return value
+
+
+class FastJSONRenderer(JSONRenderer):
+    """JSONRenderer на orjson.
+
+    Результат совпадает по байтам с компактным выводом JSONRenderer:
+    даты, Decimal, ленивые строки и прочие типы, которых нет в JSON,
+    преобразует тот же JSONEncoder из DRF. Отступы, ensure_ascii и
+    данные, которые orjson не принимает (нестроковые ключи, целые больше
+    64 бит), обрабатывает стандартный json. Отличия только у float:
+    экспонента пишется без плюса (1e300 вместо 1e+300), а NaN и
+    бесконечность — как null вместо ошибки. Без orjson класс работает
+    как обычный JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self.encoder_class().default,
+                option=ORJSON_OPTIONS,
+            )
+        except orjson.JSONEncodeError:
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+                b'\xe2\x80\xa9', b'\\u2029'
+            )
+        return ret
+
+
+class ShoppingListRendererMixin:
+    """Потоковая выгрузка списка покупок.
+
+    Ингредиенты приходят словарями с ключами ingredient__name,
+    ingredient__measurement_unit и total.
+    """
+
+    def stream(self, ingredients):
+        raise NotImplementedError
+
+
+class ShoppingListTextRenderer(ShoppingListRendererMixin, BaseRenderer):
+    """Список покупок в текстовом виде."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            return '\n'.join(str(value) for value in data.values())
+        return str(data)
+
+    def stream(self, ingredients):
+        yield 'Список покупок:\n\n'
+        separator = ''
+        for ingredient in ingredients:
+            yield (
+                f'{separator}{ingredient["ingredient__name"]} '
+                f'- {ingredient["total"]} '
+                f'{ingredient["ingredient__measurement_unit"]}.'
+            )
+            separator = '\n'
+
+
+class ShoppingListCSVRenderer(ShoppingListTextRenderer):
+    """Список покупок в формате CSV."""
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')
+        )
+        for ingredient in ingredients:
+            yield writer.writerow((
+                ingredient['ingredient__name'],
+                ingredient['total'],
+                ingredient['ingredient__measurement_unit'],
+            ))
+
+
+class ShoppingListJSONRenderer(ShoppingListRendererMixin, FastJSONRenderer):
+    """Список покупок в формате JSON."""
+
+    def stream(self, ingredients):
+        separator = '['
+        for ingredient in ingredients:
+            yield separator + json.dumps({
+                'name': ingredient['ingredient__name'],
+                'measurement_unit': ingredient['ingredient__measurement_unit'],
+                'amount': ingredient['total'],
+            }, ensure_ascii=False, separators=(',', ':'))
+            separator = ','
+        yield ']' if separator == ',' else '[]'
+
+
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListJSONRenderer,
+)
@@ -1,15 +1,18 @@
-from django.db.models import F
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.exceptions import ValidationError
 from rest_framework.fields import SerializerMethodField
 
 from .fields import Base64ImageField, Hex2NameColor
+from .metrics import SerializerTimingMixin
 from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
 from users.models import Follow, User
 from users.serializers import CustomUserSerializer
 
+MAX_BULK_RECIPES = 100
 
-class TagSerializer(serializers.ModelSerializer):
+
+class TagSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор тегов."""
     color = Hex2NameColor()
 
@@ -18,7 +21,7 @@ class TagSerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор ингрердиентов."""
 
     class Meta:
@@ -35,7 +38,7 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount')
 
 
-class RecipeReadSerializer(serializers.ModelSerializer):
+class RecipeReadSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор просмотра рецептов."""
     tags = TagSerializer(many=True, read_only=True)
     author = CustomUserSerializer(read_only=True)
@@ -48,24 +51,33 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time',
+            'is_in_shopping_cart', 'name', 'image', 'image_thumbnail',
+            'image_webp', 'text', 'cooking_time',
         )
+        read_only_fields = ('image_thumbnail', 'image_webp')
 
     def get_ingredients(self, recipe):
-        return recipe.ingredients.values(
-            'id',
-            'name',
-            'measurement_unit',
-            amount=F('ingredientrecipe__amount')
-        )
+        return [
+            {
+                'id': item.ingredient.id,
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.ingredientrecipe_set.all()
+        ]
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
         return user.favorites.filter(recipe=recipe).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
@@ -89,71 +101,109 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     def validate(self, data):
-        tags = data['tags']
-        if not tags:
+        if 'tags' in data and not data['tags']:
             raise ValidationError('Укажите тег.')
-        ingredients = data['ingredients']
-        if not ingredients:
-            raise ValidationError('Укажите ингредиенты.')
-        ingredient_list = []
-        for ingredient in ingredients:
-            if ingredient in ingredient_list:
-                raise ValidationError('Ингредиенты не должны повторяться.')
-            ingredient_list.append(ingredient)
-            if int(ingredient['amount']) < 1:
-                raise ValidationError('Укажите количество ингредиента')
-        cooking_time = data['cooking_time']
-        if int(cooking_time) < 1:
+        if 'ingredients' in data:
+            self.validate_ingredient_rows(data['ingredients'])
+        if 'cooking_time' in data and int(data['cooking_time']) < 1:
             raise ValidationError('Укажите время приготовления.')
         return data
 
-    def create_ingredients(self, ingredients, recipe):
+    def validate_ingredient_rows(self, ingredients):
+        if not ingredients:
+            raise ValidationError('Укажите ингредиенты.')
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Ингредиенты не должны повторяться.')
+        if any(int(ingredient['amount']) < 1 for ingredient in ingredients):
+            raise ValidationError('Укажите количество ингредиента')
+        missing = set(ids) - set(Ingredient.objects.in_bulk(ids))
+        if missing:
+            raise ValidationError(
+                'Нет ингредиентов с id: '
+                + ', '.join(str(pk) for pk in sorted(missing))
+            )
+
+    def set_ingredients(self, recipe, ingredients, created=False):
+        """Приводит ингредиенты рецепта к переданным.
+
+        Меняет только то, что отличается: обновляет количества, удаляет
+        лишние строки и добавляет новые.
+        """
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        rows = {} if created else {
+            row.ingredient_id: row
+            for row in IngredientRecipe.objects.filter(recipe=recipe)
+        }
+        changed = []
+        for ingredient_id, row in rows.items():
+            amount = amounts.get(ingredient_id)
+            if amount is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        removed = rows.keys() - amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
         IngredientRecipe.objects.bulk_create([
             IngredientRecipe(
                 recipe=recipe,
-                ingredient_id=ingredient['id'],
-                amount=ingredient['amount'],
+                ingredient_id=ingredient_id,
+                amount=amount,
             )
-            for ingredient in ingredients
+            for ingredient_id, amount in amounts.items()
+            if ingredient_id not in rows
         ])
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
-        self.create_ingredients(ingredients, recipe)
+        recipe.tags.add(*tags)
+        self.set_ingredients(recipe, ingredients, created=True)
         return recipe
 
+    @transaction.atomic
     def update(self, recipe, validated_data):
-        if 'ingredients' in self.initial_data:
-            ingredients = validated_data.pop('ingredients')
-            recipe.ingredients.clear()
-            self.create_ingredients(ingredients, recipe)
-        if 'tags' in self.initial_data:
-            tags_data = validated_data.pop('tags')
-            recipe.tags.set(tags_data)
+        if 'ingredients' in validated_data:
+            self.set_ingredients(recipe, validated_data.pop('ingredients'))
+        if 'tags' in validated_data:
+            recipe.tags.set(validated_data.pop('tags'))
         return super().update(recipe, validated_data)
 
     def to_representation(self, instance):
+        request = self.context.get('request')
+        instance = Recipe.objects.with_user_data(request.user).get(
+            pk=instance.pk
+        )
         return RecipeReadSerializer(
-            instance, context={'request': self.context.get('request')},
+            instance, context={'request': request},
         ).data
 
 
-class RecipeMiniSerializer(serializers.ModelSerializer):
+class RecipeMiniSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор рецептов с уменьшиным количеством полей."""
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = (
+            'id', 'name', 'image', 'image_thumbnail', 'image_webp',
+            'cooking_time',
+        )
 
 
-class FollowSerializer(serializers.ModelSerializer):
+class FollowSerializer(SerializerTimingMixin, serializers.ModelSerializer):
     """Сериализатор подписки."""
     is_subscribed = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -165,12 +215,16 @@ class FollowSerializer(serializers.ModelSerializer):
         read_only_fields = ('email', 'username', 'first_name', 'last_name')
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
         return Follow.objects.filter(user=user, author=author).exists()
 
     def get_recipes(self, author):
+        if hasattr(author, 'limited_recipes'):
+            return RecipeMiniSerializer(author.limited_recipes, many=True).data
         request = self.context['request']
         recipes_limit = request.GET.get('recipes_limit')
         recipes = Recipe.objects.filter(author=author)
@@ -178,9 +232,6 @@ class FollowSerializer(serializers.ModelSerializer):
             recipes = recipes[:int(recipes_limit)]
         return RecipeMiniSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, author):
-        return Recipe.objects.filter(author=author).count()
-
     def validate(self, data):
         user = self.context.get('request').user
         author = self.instance
@@ -192,3 +243,30 @@ class FollowSerializer(serializers.ModelSerializer):
         if user == author:
             raise ValidationError('Нельзя подписаться на себя!')
         return data
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для массового добавления и удаления."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES,
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
+
+
+class WhatToCookSerializer(serializers.Serializer):
+    """Продукты в наличии для подбора рецептов."""
+    ingredients = serializers.CharField()
+    max_missing = serializers.IntegerField(min_value=0, default=2)
+
+    def validate_ingredients(self, value):
+        try:
+            ids = {int(pk) for pk in value.split(',') if pk.strip()}
+        except ValueError:
+            raise ValidationError('Укажите id ингредиентов через запятую.')
+        if not ids:
+            raise ValidationError('Укажите ингредиенты.')
+        return ids
@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache
+from .cache import (
+    INGREDIENTS,
+    RECIPES,
+    TAGS,
+    author_namespace,
+    bump,
+    recipe_namespace,
+)
+from recipes.images import image_processed
+from recipes.loaders import catalogue_loaded
+from recipes.models import Ingredient, IngredientRecipe, Recipe, Tag
+from users.models import User
+
+
+@receiver([post_save, post_delete], sender=Tag)
+@receiver(catalogue_loaded, sender=Tag)
+def invalidate_tags(**kwargs):
+    bump(TAGS, RECIPES)
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver(catalogue_loaded, sender=Ingredient)
+def invalidate_ingredients(**kwargs):
+    bump(INGREDIENTS, RECIPES)
+
+
+def invalidate_recipes(*recipe_ids):
+    bump(RECIPES, *map(recipe_namespace, recipe_ids))
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_recipe(instance, **kwargs):
+    invalidate_recipes(instance.pk)
+
+
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+def invalidate_recipe_ingredients(instance, **kwargs):
+    invalidate_recipes(instance.recipe_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipe_tags(instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_recipes(instance.pk)
+    elif pk_set is not None:
+        invalidate_recipes(*pk_set)
+    else:
+        invalidate_tags()
+
+
+@receiver(image_processed, sender=Recipe)
+def invalidate_recipe_image(recipe_id, **kwargs):
+    invalidate_recipes(recipe_id)
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_authors(
+    instance, created=False, update_fields=None, **kwargs
+):
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    bump(RECIPES, author_namespace(instance.pk))
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(instance, **kwargs):
+    # После удаления Django обнуляет первичный ключ, то есть key.
+    key = instance.key
+    transaction.on_commit(lambda: token_cache.invalidate(key))
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(instance, created, update_fields=None, **kwargs):
+    """Смена пароля, блокировка и другие изменения пользователя."""
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    keys = list(Token.objects.filter(user=instance).values_list(
+        'key', flat=True
+    ))
+    if keys:
+        transaction.on_commit(lambda: token_cache.invalidate(*keys))
@@ -0,0 +1,1133 @@
+import asyncio
+import base64
+import io
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from unittest import mock, skipIf, skipUnless
+from urllib.parse import urlencode
+from uuid import UUID
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, transaction
+from django.http import StreamingHttpResponse
+from django.test import (
+    RequestFactory,
+    SimpleTestCase,
+    TestCase,
+    override_settings,
+)
+from django.utils.timezone import now as django_now
+from django.utils.translation import gettext_lazy
+from foodgram_backend.asgi import StreamingASGIHandler
+from foodgram_backend.db.middleware import ReplicaMiddleware
+from foodgram_backend.db.routers import ReplicaRouter
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import cards
+from .authentication import token_cache
+from .fields import BASE64_CHUNK_SIZE, Base64ImageField
+from .renderers import FastJSONRenderer
+from recipes import feed
+from recipes.cooking import (
+    CookingIndex,
+    change_key,
+    cooking_index,
+    current_version,
+)
+from recipes.counters import recount_all
+from recipes.ingredient_search import IngredientIndex
+from recipes.loaders import load_ingredients, load_tags, read_ingredients
+from recipes.models import (
+    Favorite,
+    FeedEntry,
+    Ingredient,
+    IngredientRecipe,
+    RankingEpoch,
+    Recipe,
+    ShoppingCart,
+    Tag,
+)
+from recipes.ranking import (
+    MAX_EXPONENT,
+    REBASE_EXPONENT,
+    current_epoch,
+    rebase,
+    recompute_trending,
+)
+from recipes.search import recipe_index, search_recipes, update_search_vectors
+from users.models import Follow, User
+
+
+class RecipeDataMixin:
+    """Авторы, теги и рецепты с избранным, покупками и подписками."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            User.objects.create_user(
+                username=f'author{number}',
+                email=f'author{number}@example.com',
+                password='password',
+            )
+            for number in range(2)
+        ]
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.com', password='password'
+        )
+        cls.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (
+                ('завтрак', '#FFFC66', 'breakfast'),
+                ('обед', '#54E709', 'lunch'),
+                ('ужин', '#8775D2', 'dinner'),
+            )
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(3)
+        ]
+        cls.recipes = []
+        for number in range(12):
+            recipe = Recipe.objects.create(
+                author=cls.authors[number % 2],
+                name=f'рецепт {number}',
+                image='recipes/images/test.png',
+                text='текст',
+                cooking_time=10,
+            )
+            recipe.tags.set(cls.tags[:number % 3 + 1][-2:])
+            IngredientRecipe.objects.bulk_create(
+                IngredientRecipe(
+                    recipe=recipe, ingredient=ingredient, amount=number + 1
+                )
+                for ingredient in ingredients[:number % 3 + 1]
+            )
+            cls.recipes.append(recipe)
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[::3]
+        )
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[::4]
+        )
+        Follow.objects.create(user=cls.reader, author=cls.authors[0])
+        cls.token = Token.objects.create(user=cls.reader)
+        recount_all()
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient(HTTP_HOST='localhost')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+
+class RecipeListQueriesTest(RecipeDataMixin, TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    def assert_list_queries(self, count):
+        for limit in (2, 10):
+            cache.clear()
+            token_cache.clear()
+            with self.subTest(limit=limit), self.assertNumQueries(count):
+                response = self.client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['results']), limit)
+
+    def test_cards(self):
+        self.assert_list_queries(7)
+
+    def test_anonymous(self):
+        self.client.credentials()
+        self.assert_list_queries(6)
+
+    @override_settings(RECIPE_CARDS_ENABLED=False)
+    def test_serializer(self):
+        self.assert_list_queries(6)
+
+
+class RecipeFiltersTest(RecipeDataMixin, TestCase):
+    """Сочетания фильтров рецептов."""
+
+    def get_ids(self, query):
+        response = self.client.get(f'/api/recipes/?limit=100&{query}')
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def check_plans(self):
+        """check_query_plans без скидки на маленькие таблицы фикстуры."""
+        if connection.vendor == 'postgresql':
+            # На нескольких строках Postgres выбрал бы Seq Scan и с индексом.
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        stdout = io.StringIO()
+        call_command(
+            'check_query_plans', min_rows=0, stdout=stdout,
+            stderr=io.StringIO(),
+        )
+        return stdout.getvalue()
+
+    def test_combinations(self):
+        self.assertIn('Планы запросов в порядке.', self.check_plans())
+
+    def test_missing_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP INDEX recipe_pub_date_id_idx')
+        with self.assertRaisesMessage(CommandError, 'Найдено проблем'):
+            self.check_plans()
+
+    def test_tags_without_duplicates(self):
+        ids = self.get_ids('tags=breakfast&tags=lunch')
+        self.assertCountEqual(ids, [recipe.pk for recipe in self.recipes])
+
+    def test_flags(self):
+        self.assertEqual(
+            self.get_ids('is_favorited=1&is_in_shopping_cart=1'),
+            [self.recipes[0].pk],
+        )
+        self.client.credentials()
+        self.assertEqual(self.get_ids('is_favorited=1'), [])
+
+
+class KeysetPaginationTest(RecipeDataMixin, TestCase):
+    """Пагинация по ключу: страницы без пропусков и повторов."""
+
+    def walk(self, url):
+        """id по страницам вперед; обратный проход должен их повторить."""
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append([recipe['id'] for recipe in data['results']])
+            url = data['next']
+        back = [pages[-1]]
+        url = data['previous']
+        while url:
+            data = self.client.get(url).json()
+            back.append([recipe['id'] for recipe in data['results']])
+            url = data['previous']
+        self.assertEqual(back[::-1], pages)
+        return pages
+
+    def assert_pages(self, url, expected, limit=5):
+        pages = self.walk(url)
+        self.assertTrue(all(len(page) == limit for page in pages[:-1]))
+        self.assertEqual(sum(pages, []), list(expected))
+
+    def test_recipes(self):
+        # Одинаковые pub_date у половины рецептов: порядок решает id.
+        Recipe.objects.filter(pk__in=[
+            recipe.pk for recipe in self.recipes[::2]
+        ]).update(pub_date=self.recipes[0].pub_date)
+        self.assert_pages(
+            '/api/recipes/?limit=5&cursor=',
+            Recipe.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True),
+        )
+
+    def test_popular(self):
+        for recipe in self.recipes:
+            Recipe.objects.filter(pk=recipe.pk).update(
+                popularity=recipe.pk % 3
+            )
+        self.assert_pages(
+            '/api/recipes/?ordering=popular&limit=5&cursor=',
+            Recipe.objects.order_by('-popularity', '-id')
+            .values_list('id', flat=True),
+        )
+
+    def test_filtered(self):
+        self.assert_pages(
+            f'/api/recipes/?author={self.authors[1].pk}&limit=2&cursor=',
+            Recipe.objects.filter(author=self.authors[1])
+            .order_by('-pub_date', '-id').values_list('id', flat=True),
+            limit=2,
+        )
+
+    def test_feed(self):
+        feed.rebuild()
+        self.assert_pages(
+            '/api/recipes/feed/?limit=4',
+            Recipe.objects.filter(author=self.authors[0])
+            .order_by('-pub_date', '-id').values_list('id', flat=True),
+            limit=4,
+        )
+
+    def test_search(self):
+        # Ранг зависит от числа ингредиентов: три группы равных рангов.
+        update_search_vectors()
+        recipe_index.invalidate()
+        ranks = recipe_index.search('ингредиент')
+        self.assertEqual(len(set(ranks.values())), 3)
+        self.assert_pages(
+            '/api/recipes/?' + urlencode(
+                {'search': 'ингредиент', 'limit': 5, 'cursor': ''}
+            ),
+            sorted(ranks, key=lambda pk: (-ranks[pk], -pk)),
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/recipes/?cursor=bm9wZQ==')
+        self.assertEqual(response.status_code, 404)
+
+
+class RecipeSearchTest(RecipeDataMixin, TestCase):
+    """Поиск рецептов в Postgres и в индексе в памяти."""
+    texts = (
+        ('суп с сыром', 'текст'),
+        ('сыр', 'суп'),
+        ('рецепт', 'суп суп сыр'),
+        ('суп', 'сыр ' + 'слово ' * 10),
+        ('томатный суп', 'ингредиент сыр и суп'),
+    )
+
+    def setUp(self):
+        super().setUp()
+        for recipe, (name, text) in zip(self.recipes, self.texts):
+            Recipe.objects.filter(pk=recipe.pk).update(name=name, text=text)
+        update_search_vectors()
+        recipe_index.invalidate()
+
+    def get_ids(self, query):
+        response = self.client.get(
+            '/api/recipes/', {'search': query, 'limit': 20}
+        )
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def test_order(self):
+        ranks = recipe_index.search('суп сыр')
+        self.assertEqual(len(ranks), len(self.texts))
+        self.assertEqual(
+            self.get_ids('суп сыр'),
+            sorted(ranks, key=lambda pk: (-ranks[pk], -pk)),
+        )
+        self.assertEqual(self.get_ids('сыр суп')[0], self.recipes[0].pk)
+
+    def test_explicit_ordering(self):
+        response = self.client.get(
+            '/api/recipes/', {'search': 'суп', 'ordering': 'new'}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            list(Recipe.objects.filter(
+                pk__in=recipe_index.search('суп')
+            ).order_by('-pub_date', '-id').values_list('id', flat=True)),
+        )
+
+    @skipIf(connection.vendor == 'postgresql', 'предел только без Postgres')
+    def test_limit(self):
+        with override_settings(RECIPE_SEARCH_MAX_RESULTS=2):
+            self.assertEqual(len(self.get_ids('суп')), 2)
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен Postgres')
+    def test_postgres_parity(self):
+        for query in ('суп', 'сыр', 'суп сыр', 'ингредиент', 'рецепт 7'):
+            with self.subTest(query=query):
+                expected = dict(
+                    search_recipes(Recipe.objects.all(), query)
+                    .values_list('pk', 'rank')
+                )
+                ranks = recipe_index.search(query)
+                self.assertEqual(set(ranks), set(expected))
+                for pk, rank in expected.items():
+                    self.assertAlmostEqual(ranks[pk], rank, places=6)
+
+
+class FeedTest(RecipeDataMixin, TestCase):
+    """Лента подписок: записи в лентах и рецепты популярных авторов."""
+
+    def setUp(self):
+        super().setUp()
+        feed.rebuild()
+
+    def get_ids(self):
+        response = self.client.get('/api/recipes/feed/', {'limit': 50})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.json()['results']]
+
+    def expected(self, *authors):
+        return list(
+            Recipe.objects.filter(author__in=authors)
+            .order_by('-pub_date', '-id').values_list('id', flat=True)
+        )
+
+    def create_recipe(self, author):
+        with mock.patch('recipes.signals.schedule_image_processing'), \
+                self.captureOnCommitCallbacks(execute=True):
+            return Recipe.objects.create(
+                author=author, name='новый', image='recipes/images/test.png',
+                text='текст', cooking_time=5,
+            )
+
+    def test_fan_out(self):
+        self.assertEqual(self.get_ids(), self.expected(self.authors[0]))
+        recipe = self.create_recipe(self.authors[0])
+        self.create_recipe(self.authors[1])
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, recipe=recipe
+        ).exists())
+        self.assertEqual(self.get_ids()[0], recipe.pk)
+        self.assertEqual(self.get_ids(), self.expected(self.authors[0]))
+
+    def test_subscribe_and_unsubscribe(self):
+        url = f'/api/users/{self.authors[1].pk}/subscribe/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.get_ids(), self.expected(*self.authors))
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.get_ids(), self.expected(self.authors[0]))
+
+    @override_settings(FEED_CELEBRITY_FOLLOWERS=2)
+    def test_celebrity(self):
+        celebrity, author = self.authors
+        Follow.objects.create(user=author, author=celebrity)
+        Follow.objects.create(user=self.reader, author=author)
+        feed.rebuild()
+        self.assertFalse(FeedEntry.objects.filter(author=celebrity).exists())
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, author=author
+        ).exists())
+        recipe = self.create_recipe(celebrity)
+        self.assertFalse(FeedEntry.objects.filter(recipe=recipe).exists())
+        ids = self.get_ids()
+        self.assertEqual(ids[0], recipe.pk)
+        self.assertEqual(ids, self.expected(celebrity, author))
+
+
+class ShoppingCartEtagTest(RecipeDataMixin, TestCase):
+    """ETag выгрузки списка покупок."""
+
+    def get_etag(self):
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_ingredient_rename(self):
+        etag = self.get_etag()
+        self.assertEqual(etag, self.get_etag())
+        ingredient = Ingredient.objects.first()
+        ingredient.measurement_unit = 'кг'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        self.assertNotEqual(etag, self.get_etag())
+
+    def test_amounts_in_place(self):
+        etag = self.get_etag()
+        rows = list(
+            self.recipes[8].ingredientrecipe_set.order_by('ingredient_id')
+        )
+        self.assertEqual(len(rows), 3)
+        for row, change in zip(rows, (1, -2, 1)):
+            row.amount += change
+        IngredientRecipe.objects.bulk_update(rows, ['amount'])
+        self.assertNotEqual(etag, self.get_etag())
+
+    def test_not_modified(self):
+        etag = self.get_etag()
+        response = self.client.get(
+            '/api/recipes/download_shopping_cart/', HTTP_IF_NONE_MATCH=etag
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class SubscriptionsTest(RecipeDataMixin, TestCase):
+    """Параметр recipes_limit подписок."""
+
+    def test_recipes_limit(self):
+        for value, status_code in (
+            ('1', 200), ('0', 200), ('-1', 400), ('x', 400)
+        ):
+            with self.subTest(recipes_limit=value):
+                response = self.client.get(
+                    f'/api/users/subscriptions/?recipes_limit={value}'
+                )
+                self.assertEqual(response.status_code, status_code)
+        response = self.client.get('/api/users/subscriptions/?recipes_limit=1')
+        [author] = response.json()['results']
+        self.assertEqual(len(author['recipes']), 1)
+
+
+class CountersTest(RecipeDataMixin, TestCase):
+    """Счетчики пользователей при изменениях в обход API."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = self.authors[1]
+        token = Token.objects.create(user=self.author)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def assert_counters(self, user, recipes, followers):
+        user.refresh_from_db()
+        self.assertEqual(
+            (user.recipes_count, user.followers_count), (recipes, followers)
+        )
+
+    def test_recipes_count(self):
+        self.assert_counters(self.author, 6, 0)
+        recipe = Recipe.objects.create(
+            author=self.author, name='рецепт', image='recipes/images/test.png',
+            text='текст', cooking_time=5,
+        )
+        self.assert_counters(self.author, 7, 0)
+        Recipe.objects.bulk_create([Recipe(
+            author=self.author, name='рецепт', image='recipes/images/test.png',
+            text='текст', cooking_time=5,
+        )])
+        uncounted = Recipe.objects.latest('id')
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        for pk in (recipe.pk, uncounted.pk):
+            with mock.patch('recipes.signals.schedule_image_processing'):
+                response = self.client.delete(f'/api/recipes/{pk}/')
+            self.assertEqual(response.status_code, 204)
+        self.assert_counters(self.author, 0, 0)
+
+    def test_followers_count(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assert_counters(self.author, 6, 1)
+        User.objects.filter(pk=self.author.pk).update(followers_count=0)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        response = self.client.delete(
+            f'/api/users/{self.author.pk}/subscribe/'
+        )
+        self.assertEqual(response.status_code, 204)
+        self.assert_counters(self.author, 6, 0)
+
+    def test_cascade(self):
+        self.assert_counters(self.authors[0], 6, 1)
+        self.reader.delete()
+        self.assert_counters(self.authors[0], 6, 0)
+
+
+class UserRecipeListsTest(RecipeDataMixin, TestCase):
+    """Избранное и список покупок: одиночные и массовые запросы."""
+
+    def assert_scores(self, recipe, favorites, popularity):
+        recipe.refresh_from_db()
+        self.assertEqual(
+            (recipe.favorites_count, recipe.popularity),
+            (favorites, popularity),
+        )
+        self.assertEqual(recipe.trending_score > 0, popularity > 0)
+
+    def test_add_and_remove_once(self):
+        recipe = self.recipes[1]
+        for model in (Favorite, ShoppingCart):
+            with self.subTest(model=model.__name__):
+                self.assertEqual(
+                    len(model.objects.add(self.reader, [recipe.pk])), 1
+                )
+                self.assertEqual(
+                    model.objects.add(self.reader, [recipe.pk, 9999]), []
+                )
+                rows = model.objects.remove(self.reader, [recipe.pk])
+                self.assertEqual([pk for pk, _ in rows], [recipe.pk])
+                self.assertIsNotNone(rows[0][1].tzinfo)
+                self.assertEqual(
+                    model.objects.remove(self.reader, [recipe.pk]), []
+                )
+
+    def test_single(self):
+        recipe = self.recipes[1]
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.assertEqual(self.client.post(url).status_code, 400)
+        self.assert_scores(recipe, 1, settings.RANKING_FAVORITE_WEIGHT)
+        self.assertEqual(
+            self.client.post('/api/recipes/9999/favorite/').status_code, 404
+        )
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 400)
+        self.assert_scores(recipe, 0, 0)
+
+    def test_remove_uncounted(self):
+        recipe = self.recipes[0]
+        self.assertEqual(
+            self.client.delete(
+                f'/api/recipes/{recipe.pk}/favorite/'
+            ).status_code,
+            204,
+        )
+        self.assert_scores(recipe, 0, 0)
+        self.assertEqual(recipe.trending_score, 0)
+
+    def test_bulk_favorite(self):
+        url = '/api/recipes/favorite/'
+        added, fresh = self.recipes[0], self.recipes[1]
+        ids = [added.pk, fresh.pk, 9999]
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'id': added.pk, 'status': 'exists'},
+            {'id': fresh.pk, 'status': 'added'},
+            {'id': 9999, 'status': 'not_found'},
+        ])
+        response = self.client.post(url, {'ids': ids}, format='json')
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            ['exists', 'exists', 'not_found'],
+        )
+        self.assert_scores(fresh, 1, settings.RANKING_FAVORITE_WEIGHT)
+        ids = [fresh.pk, self.recipes[2].pk]
+        response = self.client.delete(url, {'ids': ids}, format='json')
+        self.assertEqual(response.json()['results'], [
+            {'id': fresh.pk, 'status': 'removed'},
+            {'id': self.recipes[2].pk, 'status': 'absent'},
+        ])
+        response = self.client.delete(url, {'ids': ids}, format='json')
+        self.assertEqual(
+            [item['status'] for item in response.json()['results']],
+            ['absent', 'absent'],
+        )
+        self.assert_scores(fresh, 0, 0)
+
+    def test_bulk_shopping_cart(self):
+        url = '/api/recipes/shopping_cart/'
+        recipe = self.recipes[1]
+        for _ in range(2):
+            self.client.post(url, {'ids': [recipe.pk]}, format='json')
+        self.assert_scores(recipe, 0, settings.RANKING_CART_WEIGHT)
+        self.assertTrue(
+            ShoppingCart.objects.filter(
+                user=self.reader, recipe=recipe
+            ).exists()
+        )
+        for _ in range(2):
+            self.client.delete(url, {'ids': [recipe.pk]}, format='json')
+        self.assert_scores(recipe, 0, 0)
+
+
+class TokenCacheTest(RecipeDataMixin, TestCase):
+    """Кеш пользователей по токену."""
+
+    def get_me(self):
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record_query):
+            response = self.client.get('/api/users/me/')
+        token_queries = [sql for sql in queries if 'authtoken_token' in sql]
+        return response, len(token_queries)
+
+    def test_hit(self):
+        response, token_queries = self.get_me()
+        self.assertEqual((response.status_code, token_queries), (200, 1))
+        response, token_queries = self.get_me()
+        self.assertEqual((response.status_code, token_queries), (200, 0))
+        self.assertEqual(response.json()['username'], self.reader.username)
+
+    @override_settings(AUTH_TOKEN_SHARED_CACHE=True)
+    def test_shared_hit(self):
+        self.get_me()
+        token_cache.clear()
+        response, token_queries = self.get_me()
+        self.assertEqual((response.status_code, token_queries), (200, 0))
+
+    def test_token_delete(self):
+        self.get_me()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.get_me()[0].status_code, 401)
+
+    def test_user_save(self):
+        self.get_me()
+        user = User.objects.get(pk=self.reader.pk)
+        user.first_name = 'новое имя'
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        response, token_queries = self.get_me()
+        self.assertEqual(token_queries, 1)
+        self.assertEqual(response.json()['first_name'], 'новое имя')
+        user.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save()
+        self.assertEqual(self.get_me()[0].status_code, 401)
+
+    def test_last_login_keeps_cache(self):
+        self.get_me()
+        user = User.objects.get(pk=self.reader.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            user.save(update_fields=['last_login'])
+        self.assertEqual(self.get_me()[1], 0)
+
+
+class ResponseCacheTest(RecipeDataMixin, TestCase):
+    """Кеш ответов list/retrieve."""
+
+    def test_host_in_key(self):
+        self.client.credentials()
+        url = f'/api/recipes/{self.recipes[0].pk}/'
+        for host in ('localhost', 'testserver', 'localhost'):
+            with self.subTest(host=host):
+                response = self.client.get(url, HTTP_HOST=host)
+                self.assertTrue(
+                    response.json()['image'].startswith(f'http://{host}/')
+                )
+
+    def test_loaded_tags(self):
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            load_tags([{'name': 'десерт', 'color': '#E26C2D',
+                        'slug': 'dessert'}])
+        self.assertEqual(len(self.client.get('/api/tags/').json()), 4)
+
+
+class LoadersTest(TestCase):
+    """Повторная загрузка справочников ничего не дублирует."""
+
+    def test_catalogue(self):
+        stdout = io.StringIO()
+        call_command('load_catalogue', stdout=stdout)
+        counts = (Tag.objects.count(), Ingredient.objects.count())
+        self.assertGreater(min(counts), 0)
+        call_command('load_catalogue', stdout=stdout)
+        self.assertEqual(
+            (Tag.objects.count(), Ingredient.objects.count()), counts
+        )
+        self.assertIn('Добавлено тегов: 0, ингредиентов: 0', stdout.getvalue())
+
+    def test_ingredients(self):
+        path = settings.BASE_DIR / 'data' / 'ingredients.csv'
+        created = load_ingredients(read_ingredients(path), batch_size=100)
+        self.assertEqual(created, Ingredient.objects.count())
+        self.assertEqual(
+            load_ingredients(read_ingredients(path), batch_size=100), 0
+        )
+        rows = [
+            {'name': ' соль ', 'measurement_unit': 'г'},
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'новый продукт', 'measurement_unit': 'шт'},
+            {'name': 'новый продукт', 'measurement_unit': 'шт'},
+        ]
+        self.assertEqual(load_ingredients(rows), 1)
+        self.assertEqual(load_ingredients(rows), 0)
+        self.assertEqual(Ingredient.objects.count(), created + 1)
+
+    def test_tags(self):
+        rows = [{'name': 'завтрак', 'color': '#FFFC66', 'slug': 'breakfast'}]
+        self.assertEqual(load_tags(rows * 2), 1)
+        self.assertEqual(load_tags(rows), 0)
+
+
+class InMemoryIndexTest(RecipeDataMixin, TestCase):
+    """Срок жизни индексов в памяти задается для каждого индекса."""
+
+    @override_settings(INGREDIENT_INDEX_TTL=0, COOKING_INDEX_TTL=3600)
+    def test_own_ttl(self):
+        for index_class, loads in ((IngredientIndex, 3), (CookingIndex, 1)):
+            index = index_class()
+            with self.subTest(index=index_class.__name__), mock.patch.object(
+                index, '_load', wraps=index._load
+            ) as load:
+                for _ in range(3):
+                    index._get_data()
+                self.assertEqual(load.call_count, loads)
+
+
+class WhatToCookTest(RecipeDataMixin, TestCase):
+    """Подбор рецептов по продуктам в наличии."""
+
+    def setUp(self):
+        super().setUp()
+        cooking_index.invalidate()
+        self.ingredients = list(
+            Ingredient.objects.order_by('id').values_list('id', flat=True)
+        )
+
+    def get_matches(self, **params):
+        response = self.client.get('/api/recipes/what_to_cook/', {
+            'limit': 20, 'ingredients': str(self.ingredients[0]), **params,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe['id'], recipe['matched_ingredients'],
+             recipe['missing_ingredients'])
+            for recipe in response.json()['results']
+        ]
+
+    def expected(self, recipes, max_missing):
+        # У рецепта number первые number % 3 + 1 ингредиентов.
+        matches = [
+            (recipe.pk, 1, number % 3)
+            for number, recipe in enumerate(recipes)
+            if number % 3 <= max_missing
+        ]
+        return sorted(matches, key=lambda match: (
+            -1 / (1 + match[2]), match[2], -match[0]
+        ))
+
+    def test_order(self):
+        for max_missing in (0, 1, 2):
+            with self.subTest(max_missing=max_missing):
+                self.assertEqual(
+                    self.get_matches(max_missing=max_missing),
+                    self.expected(self.recipes, max_missing),
+                )
+
+    def test_filters(self):
+        author = self.authors[1]
+        self.assertEqual(
+            self.get_matches(author=author.pk, max_missing=1),
+            [
+                match for match in self.expected(self.recipes, 1)
+                if match[0] in {recipe.pk for recipe in self.recipes[1::2]}
+            ],
+        )
+
+    def test_without_numpy(self):
+        have = set(self.ingredients[:2])
+        expected = cooking_index.search(have, 1)
+        with mock.patch('recipes.cooking.numpy', None):
+            self.assertEqual(cooking_index.search(have, 1), expected)
+
+    def test_changes_from_other_process(self):
+        other = CookingIndex()
+        other.search({self.ingredients[0]}, 0)
+        recipe = self.recipes[1]
+        IngredientRecipe.objects.filter(recipe=recipe).exclude(
+            ingredient_id=self.ingredients[0]
+        ).delete()
+        with mock.patch.object(other, '_load', wraps=other._load) as load:
+            cooking_index.publish([recipe.pk])
+            self.assertIn(
+                (recipe.pk, 1, 0), other.search({self.ingredients[0]}, 0)
+            )
+            self.assertEqual(load.call_count, 0)
+            cooking_index.publish([recipe.pk])
+            cache.delete(change_key(current_version()))
+            other.search({self.ingredients[0]}, 0)
+            self.assertEqual(load.call_count, 1)
+
+
+class FastJSONRendererTest(TestCase):
+    """FastJSONRenderer отдает те же байты, что и JSONRenderer из DRF."""
+    data = {
+        'decimal': Decimal('12.50'),
+        'decimals': [Decimal('0.1'), Decimal('1E+2'), Decimal('-3')],
+        'datetime': datetime(
+            2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc
+        ),
+        'naive': datetime(2026, 3, 1, 12, 30),
+        'date': date(2026, 3, 1),
+        'time': time(8, 5, 1, 500),
+        'duration': timedelta(days=1, seconds=30),
+        'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+        'lazy': gettext_lazy('Рецепт уже добавлен!'),
+        'lazy_list': [gettext_lazy('Избранное'), 'строка\u2028с\u2029'],
+        'nested': {'tuple': (1, 'два', None), 'flag': True},
+        'big': 2 ** 70,
+        1: 'нестроковый ключ',
+    }
+
+    def assert_same(self, data):
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+
+    def test_types(self):
+        for key, value in self.data.items():
+            with self.subTest(key=key):
+                self.assert_same({'value': value})
+        self.assert_same(self.data)
+
+    def test_without_orjson(self):
+        with mock.patch('api.renderers.orjson', None):
+            self.assert_same(self.data)
+
+
+class StreamingASGIHandlerTest(TestCase):
+    """Потоковые ответы в режиме ASGI."""
+
+    async def test_parts_outside_event_loop(self):
+        in_event_loop = []
+
+        def content():
+            for number in range(3):
+                try:
+                    asyncio.get_running_loop()
+                except RuntimeError:
+                    in_event_loop.append(False)
+                else:
+                    in_event_loop.append(True)
+                yield str(number)
+
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await StreamingASGIHandler().send_response(
+            StreamingHttpResponse(content(), content_type='text/plain'), send
+        )
+        self.assertEqual(in_event_loop, [False] * 3)
+        self.assertEqual(messages[0]['status'], 200)
+        self.assertIn(
+            (b'Content-Type', b'text/plain'), messages[0]['headers']
+        )
+        self.assertEqual(
+            b''.join(message.get('body', b'') for message in messages[1:]),
+            b'012',
+        )
+        self.assertFalse(messages[-1].get('more_body', False))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'нужен Postgres')
+class ConnectionHealthCheckTest(TestCase):
+    """Оборванное между запросами соединение заменяется новым."""
+
+    def setUp(self):
+        wrapper = type(connections['default'])({
+            **connection.settings_dict,
+            'CONN_MAX_AGE': 60,
+            'CONN_HEALTH_CHECKS': True,
+            'POOL_SIZE': 0,
+        }, alias='health')
+        connections['health'] = wrapper
+        self.addCleanup(delattr, connections._connections, 'health')
+        self.addCleanup(wrapper.close)
+        self.wrapper = wrapper
+
+    def backend_pid(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_atomic_first(self):
+        pid = self.backend_pid()
+        self.wrapper.close_if_unusable_or_obsolete()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+        self.wrapper.close_if_unusable_or_obsolete()
+        with transaction.atomic(using='health'):
+            self.assertNotEqual(self.backend_pid(), pid)
+
+
+@mock.patch(
+    'foodgram_backend.db.middleware.replica_aliases',
+    return_value=['replica_1', 'replica_2'],
+)
+class ReplicaRoutingTest(SimpleTestCase):
+    """Чтение из реплик и чтение своих изменений после записи."""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.router = ReplicaRouter()
+
+    def route(self, request):
+        return {
+            'read': self.router.db_for_read(Recipe),
+            'token': self.router.db_for_read(Token),
+            'write': self.router.db_for_write(Recipe),
+        }
+
+    def request(self, middleware, method, token='reader'):
+        return middleware(getattr(self.factory, method)(
+            '/api/recipes/', HTTP_AUTHORIZATION=f'Token {token}'
+        ))
+
+    def test_reads(self, _):
+        middleware = ReplicaMiddleware(self.route)
+        self.assertEqual(
+            [self.request(middleware, 'get')['read'] for _ in range(3)],
+            ['replica_1', 'replica_2', 'replica_1'],
+        )
+        self.assertEqual(
+            self.request(middleware, 'get'),
+            {'read': 'replica_2', 'token': 'default', 'write': 'default'},
+        )
+        self.assertEqual(self.router.db_for_read(Recipe), 'default')
+
+    def test_transaction(self, _):
+        middleware = ReplicaMiddleware(self.route)
+        with mock.patch.object(
+            connections['default'], 'in_atomic_block', True
+        ):
+            self.assertEqual(
+                self.request(middleware, 'get')['read'], 'default'
+            )
+
+    def test_read_your_writes(self, _):
+        middleware = ReplicaMiddleware(self.route)
+        self.assertEqual(
+            self.request(middleware, 'post'),
+            {'read': 'default', 'token': 'default', 'write': 'default'},
+        )
+        self.assertEqual(self.request(middleware, 'get')['read'], 'default')
+        self.assertEqual(
+            self.request(middleware, 'get', token='other')['read'],
+            'replica_1',
+        )
+        cache.clear()
+        self.assertEqual(
+            self.request(middleware, 'get')['read'], 'replica_2'
+        )
+
+    @override_settings(DB_REPLICA_STICKY_SECONDS=0)
+    def test_sticky_expired(self, _):
+        middleware = ReplicaMiddleware(self.route)
+        self.request(middleware, 'delete')
+        self.assertEqual(
+            self.request(middleware, 'get')['read'], 'replica_1'
+        )
+
+
+class Base64ImageFieldTest(TestCase):
+    """Декодирование картинок из base64."""
+
+    def test_wrapped_lines(self):
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (200, 200), os.urandom(120000)).save(
+            buffer, 'PNG'
+        )
+        content = buffer.getvalue()
+        encoded = base64.encodebytes(content).decode()
+        self.assertGreater(len(encoded), BASE64_CHUNK_SIZE)
+        file = Base64ImageField().to_internal_value(
+            'data:image/png;base64,' + encoded
+        )
+        file.seek(0)
+        self.assertEqual(file.read(), content)
+
+
+class RecipeReindexTest(RecipeDataMixin, TestCase):
+    """Переиндексация рецепта один раз на транзакцию."""
+
+    def setUp(self):
+        super().setUp()
+        # TestCase не фиксирует транзакцию, колбэк фикстуры не выполнится.
+        connection.reindex_callback = None
+        token = Token.objects.create(user=self.authors[0])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.recipe = self.recipes[2]
+        self.assertEqual(self.recipe.ingredientrecipe_set.count(), 3)
+
+    def assert_reindexed_once(self, method, **kwargs):
+        with mock.patch('recipes.signals.reindex_recipes') as reindex, \
+                mock.patch('recipes.signals.schedule_image_processing'):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = method(
+                    f'/api/recipes/{self.recipe.pk}/', format='json', **kwargs
+                )
+            self.assertLess(response.status_code, 300)
+        reindex.assert_called_once_with({self.recipe.pk})
+
+    def test_update(self):
+        ingredient = self.recipe.ingredientrecipe_set.first().ingredient_id
+        self.assert_reindexed_once(self.client.patch, data={
+            'ingredients': [{'id': ingredient, 'amount': 5}],
+        })
+
+    def test_delete(self):
+        self.assert_reindexed_once(self.client.delete)
+
+
+class RecipeCardsTest(RecipeDataMixin, TestCase):
+    """Сброс кеша карточек рецептов."""
+
+    def get_encoded(self):
+        """Число карточек, сериализованных заново для первой страницы."""
+        with mock.patch.object(
+            cards, 'encode_card', wraps=cards.encode_card
+        ) as encode:
+            response = self.client.get('/api/recipes/?limit=10')
+        self.assertEqual(response.status_code, 200)
+        return encode.call_count
+
+    def assert_encoded(self, count, change):
+        self.assertEqual(self.get_encoded(), 10)
+        with mock.patch('recipes.signals.schedule_image_processing'), \
+                self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertEqual(self.get_encoded(), count)
+
+    def test_recipe_change(self):
+        recipe = self.recipes[-1]
+        recipe.name = 'новое название'
+        self.assert_encoded(1, recipe.save)
+
+    def test_recipe_tags(self):
+        self.assert_encoded(
+            1, lambda: self.recipes[-1].tags.add(self.tags[-1])
+        )
+
+    def test_author_change(self):
+        author = self.authors[0]
+        author.first_name = 'Иван'
+        self.assert_encoded(5, author.save)
+
+    def test_new_user(self):
+        self.assert_encoded(0, lambda: User.objects.create_user(
+            username='new', email='new@example.com', password='password'
+        ))
+
+
+@override_settings(RANKING_HALF_LIFE_HOURS=6)
+class RankingEpochTest(RecipeDataMixin, TestCase):
+    """Перенос точки отсчета trending_score."""
+
+    def set_epoch(self, half_lives):
+        """Сдвигает точку отсчета назад и пересчитывает оценки от нее."""
+        epoch = django_now() - timedelta(
+            hours=half_lives * settings.RANKING_HALF_LIFE_HOURS
+        )
+        RankingEpoch.objects.filter(pk=1).update(epoch=epoch)
+        recompute_trending()
+        return epoch
+
+    def test_rebase_on_write(self):
+        epoch = self.set_epoch(REBASE_EXPONENT + 1)
+        recipe = self.recipes[1]
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        self.assertGreater(current_epoch(), epoch)
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(
+            recipe.trending_score, settings.RANKING_FAVORITE_WEIGHT, places=3
+        )
+        self.assertEqual(recompute_trending(), 0)
+
+    def test_rebase_keeps_order(self):
+        self.set_epoch(REBASE_EXPONENT - 10)
+        for recipe in self.recipes[1:3]:
+            self.client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        scores = dict(Recipe.objects.values_list('pk', 'trending_score'))
+        self.assertFalse(rebase())
+        self.assertTrue(rebase(django_now() + timedelta(
+            hours=10 * settings.RANKING_HALF_LIFE_HOURS
+        )))
+        for pk, score in Recipe.objects.values_list('pk', 'trending_score'):
+            self.assertAlmostEqual(
+                score, scores[pk] * 2 ** -REBASE_EXPONENT,
+                delta=scores[pk] * 1e-9,
+            )
+
+    def test_overflow(self):
+        url = f'/api/recipes/{self.recipes[1].pk}/favorite/'
+        with self.assertLogs('recipes.ranking', 'WARNING'):
+            self.set_epoch(MAX_EXPONENT * 40)
+            self.assertEqual(self.client.post(url).status_code, 201)
+            self.assertEqual(self.client.delete(url).status_code, 204)
+
+    def test_recompute(self):
+        with self.assertLogs('recipes.ranking', 'WARNING'):
+            self.set_epoch(MAX_EXPONENT * 40)
+        stdout = io.StringIO()
+        call_command('recompute_rankings', stdout=stdout)
+        self.assertIn('точка отсчета перенесена', stdout.getvalue())
+        self.assertEqual(recompute_trending(), 0)
+        recipe = self.recipes[3]
+        recipe.refresh_from_db()
+        self.assertAlmostEqual(
+            recipe.trending_score, settings.RANKING_FAVORITE_WEIGHT, places=3
+        )
@@ -1,7 +1,13 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet
+from .views import (
+    CacheStatsView,
+    IngredientViewSet,
+    MetricsView,
+    RecipeViewSet,
+    TagViewSet,
+)
 
 router = routers.DefaultRouter()
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
@@ -9,5 +15,7 @@ router.register(r'tags', TagViewSet, basename='tags')
 router.register(r'recipes', RecipeViewSet, basename='recipes')
 
 urlpatterns = [
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
     path('', include(router.urls)),
 ]
@@ -1,23 +1,39 @@
+import hashlib
+
+from django.conf import settings
+from django.db import transaction
 from django.db.models import Sum
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
 from rest_framework.exceptions import ValidationError
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from .cache import INGREDIENTS, RECIPES, TAGS, CachedResponseMixin, get_stats
+from .cards import cards_response
 from .filters import IngredientFilter, RecipeFilter
-from .pagination import CustomPagination
+from .metrics import registry
+from .pagination import CustomPagination, FeedPagination, RecipePagination
 from .permissions import IsAdminOrReadOnly, IsAuthorOrAdminOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
 from .serializers import (
     IngredientSerializer,
     RecipeCreateSerializer,
+    RecipeIdsSerializer,
     RecipeMiniSerializer,
     RecipeReadSerializer,
     TagSerializer,
+    WhatToCookSerializer,
 )
+from recipes.cooking import cooking_index
+from recipes.feed import feed_sources
+from recipes.ingredient_search import ingredient_index
 from recipes.models import (
     Favorite,
     Ingredient,
@@ -26,32 +42,70 @@ from recipes.models import (
     ShoppingCart,
     Tag,
 )
+from recipes.ranking import update_scores
+
+SHOPPING_LIST_CHUNK_SIZE = 500
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет ингрердиентов."""
+    cache_namespaces = (INGREDIENTS,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [IsAdminOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if not name or not settings.INGREDIENT_INDEX_ENABLED:
+            return super().list(request, *args, **kwargs)
+        return self.cached_response(self.search, request, name)
+
+    def search(self, request, name):
+        serializer = self.get_serializer(
+            ingredient_index.search(name), many=True
+        )
+        return Response(serializer.data)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет тегов."""
+    cache_namespaces = (TAGS,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [IsAdminOrReadOnly]
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedResponseMixin, viewsets.ModelViewSet):
     """Вьюсет рецептов."""
-    queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    cache_namespaces = (RECIPES,)
+    cached_actions = ('retrieve',)
+    cache_anonymous_only = True
+    pagination_class = RecipePagination
     permission_classes = [IsAuthorOrAdminOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        return Recipe.objects.with_user_data(self.request.user)
+
+    def use_cards(self, request):
+        return (
+            settings.RECIPE_CARDS_ENABLED
+            and request.accepted_renderer.format == 'json'
+        )
+
+    def list(self, request, *args, **kwargs):
+        if not self.use_cards(request):
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(
+            Recipe.objects.with_flags(request.user)
+        )
+        page = self.paginate_queryset(queryset)
+        return cards_response(self.paginator, page, request)
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -61,25 +115,54 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeCreateSerializer
 
     def create_or_del_method(self, model, request, pk):
-        recipe = get_object_or_404(Recipe, id=pk)
         if request.method == 'POST':
-            if not model.objects.filter(
-                user=self.request.user,
-                recipe=get_object_or_404(Recipe, id=pk)
-            ).exists():
-                model.objects.create(user=self.request.user, recipe=recipe)
-                serializer = RecipeMiniSerializer(recipe)
-                return Response(
-                    serializer.data, status=status.HTTP_201_CREATED
-                )
-            raise ValidationError('Рецепт уже добавлен!')
-        if model.objects.filter(
-                user=self.request.user,
-                recipe=recipe).exists():
-            model.objects.filter(
-                user=self.request.user, recipe=recipe
-            ).delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
+            recipe = get_object_or_404(Recipe, id=pk)
+            with transaction.atomic():
+                rows = model.objects.add(request.user, [recipe.id])
+                if not rows:
+                    raise ValidationError('Рецепт уже добавлен!')
+                update_scores(model, rows, 1)
+            serializer = RecipeMiniSerializer(recipe)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
+        with transaction.atomic():
+            rows = model.objects.remove(request.user, [pk])
+            if not rows:
+                raise ValidationError('Рецепта нет в списке!')
+            update_scores(model, rows, -1)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @transaction.atomic
+    def bulk_method(self, model, request):
+        """Добавляет или удаляет сразу несколько рецептов.
+
+        Для каждого id возвращает результат: added, exists или
+        not_found при добавлении, removed или absent при удалении.
+        Оценки меняются только по строкам, которые вставил или удалил
+        сам запрос.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        if request.method == 'POST':
+            rows = model.objects.add(request.user, ids)
+            outcomes = dict.fromkeys(
+                Recipe.objects.filter(pk__in=ids).values_list(
+                    'pk', flat=True
+                ),
+                'exists',
+            )
+            outcomes.update((pk, 'added') for pk, _ in rows)
+            default = 'not_found'
+            delta = 1
+        else:
+            rows = model.objects.remove(request.user, ids)
+            outcomes = {pk: 'removed' for pk, _ in rows}
+            default = 'absent'
+            delta = -1
+        update_scores(model, rows, delta)
+        return Response({'results': [
+            {'id': pk, 'status': outcomes.get(pk, default)} for pk in ids
+        ]})
 
     @action(
         detail=True,
@@ -99,24 +182,159 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         detail=False,
-        methods=('get',),
-        permission_classes=(IsAuthenticated,)
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='favorite',
+        url_name='favorite-bulk',
     )
-    def download_shopping_cart(self, request):
-        ingredients = IngredientRecipe.objects.filter(
+    def favorite_bulk(self, request):
+        return self.bulk_method(Favorite, request)
+
+    @action(
+        detail=False,
+        methods=['post', 'delete'],
+        permission_classes=[IsAuthenticated],
+        url_path='shopping_cart',
+        url_name='shopping-cart-bulk',
+    )
+    def shopping_cart_bulk(self, request):
+        return self.bulk_method(ShoppingCart, request)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, новые первыми."""
+        paginator = FeedPagination()
+        page = paginator.paginate_queryset(
+            feed_sources(request.user), request, view=self
+        )
+        if self.use_cards(request):
+            recipes = Recipe.objects.with_flags(request.user).in_bulk(
+                [item.pk for item in page]
+            )
+            return cards_response(
+                paginator,
+                [recipes[item.pk] for item in page if item.pk in recipes],
+                request,
+            )
+        recipes = self.get_queryset().in_bulk([item.pk for item in page])
+        serializer = RecipeReadSerializer(
+            [recipes[item.pk] for item in page if item.pk in recipes],
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def what_to_cook(self, request):
+        """Рецепты из продуктов в наличии.
+
+        Сначала рецепты с наибольшей долей имеющихся продуктов. Работают
+        те же фильтры, что и в списке рецептов.
+        """
+        serializer = WhatToCookSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        matches = cooking_index.search(
+            serializer.validated_data['ingredients'],
+            serializer.validated_data['max_missing'],
+        )
+        allowed = set(
+            self.filter_queryset(Recipe.objects.all())
+            .filter(pk__in=[recipe_id for recipe_id, _, _ in matches])
+            .values_list('pk', flat=True)
+        )
+        paginator = CustomPagination()
+        page = paginator.paginate_queryset(
+            [match for match in matches if match[0] in allowed],
+            request,
+            view=self,
+        )
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _, _ in page]
+        )
+        page = [match for match in page if match[0] in recipes]
+        data = RecipeReadSerializer(
+            [recipes[recipe_id] for recipe_id, _, _ in page],
+            many=True,
+            context=self.get_serializer_context(),
+        ).data
+        for item, (_, have, missing) in zip(data, page):
+            item['matched_ingredients'] = have
+            item['missing_ingredients'] = missing
+        return paginator.get_paginated_response(data)
+
+    def get_shopping_cart_totals(self, request):
+        return IngredientRecipe.objects.filter(
             recipe__shopping_cart__user=request.user
         ).values(
             'ingredient__name',
             'ingredient__measurement_unit'
-        ).annotate(total=Sum('amount'))
-        filename = 'shopping_list.txt'
-        shopping_list = 'Список покупок:\n\n'
-        shopping_list += '\n'.join([
-            f'{ingredient["ingredient__name"]} '
-            f'- {ingredient["total"]} '
-            f'{ingredient["ingredient__measurement_unit"]}.'
-            for ingredient in ingredients
-        ])
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        response['Content-Disposition'] = f'attachment; filename={filename}'
+        ).annotate(
+            total=Sum('amount')
+        ).order_by(
+            'ingredient__name',
+            'ingredient__measurement_unit'
+        )
+
+    def get_shopping_cart_etag(self, totals, format):
+        """ETag корзины — хеш итоговых строк выгрузки.
+
+        Строки читаются потоком, как и при выгрузке, поэтому ETag
+        меняется при любом изменении названий, единиц или количеств.
+        """
+        digest = hashlib.md5(format.encode())
+        for row in totals.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE):
+            digest.update(
+                ('\t'.join(map(str, row.values())) + '\n').encode()
+            )
+        return quote_etag(digest.hexdigest())
+
+    @action(
+        detail=False,
+        methods=('get',),
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=SHOPPING_LIST_RENDERERS,
+    )
+    def download_shopping_cart(self, request):
+        totals = self.get_shopping_cart_totals(request)
+        renderer = request.accepted_renderer
+        etag = self.get_shopping_cart_etag(totals, renderer.format)
+        response = get_conditional_response(request, etag=etag)
+        if response is not None:
+            return response
+        response = StreamingHttpResponse(
+            renderer.stream(
+                totals.iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+            ),
+            content_type=f'{renderer.media_type}; charset=utf-8',
+        )
+        response['ETag'] = etag
+        response['Content-Disposition'] = (
+            f'attachment; filename=shopping_list.{renderer.format}'
+        )
         return response
+
+
+class CacheStatsView(APIView):
+    """Статистика кеша ответов."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        stats = {}
+        for (event, namespace), count in get_stats().items():
+            stats.setdefault(namespace, {})[event] = count
+        return Response(stats)
+
+
+class MetricsView(APIView):
+    """Метрики запросов в текстовом формате Prometheus."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
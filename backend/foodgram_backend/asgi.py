@@ -1,7 +1,81 @@
 import os
+from itertools import islice
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_backend.settings')
 
-application = get_asgi_application()
+# Столько кусков потокового ответа забирается из потока запроса за раз.
+STREAMING_BATCH_SIZE = 64
+
+
+def take(parts, count):
+    return list(islice(parts, count))
+
+
+class StreamingASGIHandler(ASGIHandler):
+    """ASGIHandler, который перебирает потоковый ответ в потоке запроса.
+
+    Django 3.2 перебирает потоковый ответ прямо в цикле событий, где
+    обращения к БД запрещены, и генератор с запросами падает с
+    SynchronousOnlyOperation. Здесь куски забираются пачками через
+    sync_to_async, как в Django 4.2, и уходят клиенту по мере готовности.
+    """
+
+    @staticmethod
+    def response_headers(response):
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append((
+                b'Set-Cookie',
+                cookie.output(header='').encode('ascii').strip(),
+            ))
+        return headers
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.response_headers(response),
+        })
+        parts = iter(response)
+        next_parts = sync_to_async(take, thread_sensitive=True)
+        while True:
+            batch = await next_parts(parts, STREAMING_BATCH_SIZE)
+            if not batch:
+                break
+            for part in batch:
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+django.setup(set_prefix=False)
+django_application = StreamingASGIHandler()
+
+
+async def application(scope, receive, send):
+    """ASGI-приложение, где у каждого запроса свой поток для
+    синхронного кода.
+
+    Django 3.2 выполняет middleware, ORM и синхронные вьюхи всех
+    запросов процесса в одном общем потоке, и запросы ждут друг друга.
+    ThreadSensitiveContext дает запросу отдельный поток, как в Django 4.
+    """
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -0,0 +1,48 @@
+import hashlib
+from itertools import cycle
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.permissions import SAFE_METHODS
+
+from .routers import replica_aliases, use_database
+
+
+def sticky_key(request):
+    """Ключ закрепления за основной базой по токену или сессии."""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or (
+        request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    return 'db-primary:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+class ReplicaMiddleware:
+    """Выбор реплики для безопасных запросов.
+
+    Реплики берутся по кругу, одна на запрос. После записи
+    пользователь DB_REPLICA_STICKY_SECONDS секунд читает из основной
+    базы и видит свои изменения, даже если реплика отстает. Метка
+    хранится в кеше, поэтому с несколькими процессами нужен общий кеш.
+    """
+
+    def __init__(self, get_response):
+        aliases = replica_aliases()
+        if not aliases:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.replicas = cycle(aliases)
+
+    def __call__(self, request):
+        key = sticky_key(request)
+        if request.method in SAFE_METHODS:
+            if key is not None and cache.get(key):
+                return self.get_response(request)
+            with use_database(next(self.replicas)):
+                return self.get_response(request)
+        response = self.get_response(request)
+        if key is not None:
+            cache.set(key, True, settings.DB_REPLICA_STICKY_SECONDS)
+        return response
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+stats = Counter()
+stats_lock = threading.Lock()
+
+
+def record(event, amount=1):
+    with stats_lock:
+        stats[event] += amount
+
+
+def get_stats():
+    """Счетчики соединений с базой в этом процессе."""
+    with stats_lock:
+        return dict(stats)
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    """Пул соединений psycopg2 для потоков одного процесса.
+
+    Свободные соединения выдаются в обратном порядке, чтобы в работе
+    оставались «горячие». Если все size соединений заняты, поток ждет
+    освобождения не дольше timeout секунд. Соединения в транзакции или
+    оборванные в пул не возвращаются.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.idle = deque()
+        self.in_use = 0
+        self.condition = threading.Condition()
+        self.pid = os.getpid()
+
+    def get(self, connect):
+        """Возвращает (соединение, взято ли из пула)."""
+        started = None
+        with self.condition:
+            while True:
+                while self.idle:
+                    connection = self.idle.pop()
+                    if healthy(connection):
+                        self.in_use += 1
+                        self.record_wait(started)
+                        return connection, True
+                    close(connection)
+                if self.in_use < self.size:
+                    self.in_use += 1
+                    self.record_wait(started)
+                    break
+                if started is None:
+                    started = time.perf_counter()
+                    record('waits')
+                remaining = self.timeout - (time.perf_counter() - started)
+                if remaining <= 0:
+                    record('timeouts')
+                    self.record_wait(started)
+                    raise PoolTimeout(
+                        f'Нет свободных соединений за {self.timeout} с.'
+                    )
+                self.condition.wait(remaining)
+        try:
+            return connect(), False
+        except BaseException:
+            with self.condition:
+                self.in_use -= 1
+                self.condition.notify()
+            raise
+
+    def put(self, connection):
+        if connection.closed:
+            keep = False
+        else:
+            if connection.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                try:
+                    connection.rollback()
+                except OperationalError:
+                    pass
+            keep = healthy(connection)
+        if not keep:
+            record('discarded')
+            close(connection)
+        with self.condition:
+            self.in_use -= 1
+            if keep:
+                self.idle.append(connection)
+            self.condition.notify()
+
+    def record_wait(self, started):
+        if started is not None:
+            record('wait_seconds', time.perf_counter() - started)
+
+
+def healthy(connection):
+    return (
+        not connection.closed
+        and connection.get_transaction_status() == TRANSACTION_STATUS_IDLE
+    )
+
+
+def close(connection):
+    try:
+        connection.close()
+    except OperationalError:
+        pass
+
+
+pools = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(alias, size, timeout):
+    """Пул базы alias в текущем процессе.
+
+    После fork пул родителя не используется: его соединения принадлежат
+    другому процессу.
+    """
+    with pools_lock:
+        pool = pools.get(alias)
+        if pool is None or pool.pid != os.getpid():
+            pool = pools[alias] = ConnectionPool(size, timeout)
+        return pool
+
+
+def pool_sizes():
+    """Свободные и занятые соединения пулов: {alias: (idle, in_use)}."""
+    with pools_lock:
+        return {
+            alias: (len(pool.idle), pool.in_use)
+            for alias, pool in pools.items()
+            if pool.pid == os.getpid()
+        }
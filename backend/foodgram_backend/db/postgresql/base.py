@@ -0,0 +1,122 @@
+import time
+from functools import partial
+
+from django.db.backends.postgresql import base
+from foodgram_backend.db.pool import get_pool, record
+from psycopg2 import Error
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """Postgres с проверкой постоянных соединений и пулом.
+
+    CONN_HEALTH_CHECKS: соединение, оставшееся с прошлого запроса или
+    взятое из пула, проверяется запросом SELECT 1 перед первым
+    обращением, в том числе перед началом транзакции, оборванное
+    заменяется новым, как в Django 4.1.
+    POOL_SIZE: соединения берутся из пула процесса и возвращаются в него
+    в конце каждого запроса; CONN_MAX_AGE при этом не используется.
+    """
+
+    reuse_checked = True
+
+    @property
+    def pool(self):
+        size = self.settings_dict.get('POOL_SIZE') or 0
+        if size <= 0:
+            return None
+        return get_pool(
+            self.alias, size, self.settings_dict.get('POOL_TIMEOUT', 10)
+        )
+
+    def connect(self):
+        super().connect()
+        if self.pool is not None:
+            self.close_at = time.monotonic()
+
+    def get_new_connection(self, conn_params):
+        started = time.perf_counter()
+        connect = partial(
+            base.DatabaseWrapper.get_new_connection, self, conn_params
+        )
+        pool = self.pool
+        if pool is None:
+            connection, reused = connect(), False
+        else:
+            connection, reused = self.get_pooled_connection(pool, connect)
+        record('acquired')
+        if reused:
+            record('reused')
+            options = self.settings_dict['OPTIONS']
+            self.isolation_level = options.get(
+                'isolation_level', connection.isolation_level
+            )
+        else:
+            record('opened')
+            record('connect_seconds', time.perf_counter() - started)
+        self.reuse_checked = True
+        return connection
+
+    def get_pooled_connection(self, pool, connect):
+        """Соединение из пула; оборванные закрываются и заменяются."""
+        while True:
+            connection, reused = pool.get(connect)
+            if (
+                not reused
+                or not self.settings_dict.get('CONN_HEALTH_CHECKS')
+                or is_usable(connection)
+            ):
+                return connection, reused
+            record('health_check_failed')
+            connection.close()
+            pool.put(connection)
+
+    def _close(self):
+        pool = self.pool
+        if pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            if self.in_atomic_block:
+                self.connection.close()
+            pool.put(self.connection)
+
+    def ensure_connection(self):
+        self.check_reused_connection()
+        super().ensure_connection()
+
+    def check_reused_connection(self):
+        """Учитывает соединение прошлого запроса и проверяет его.
+
+        Вызывается из ensure_connection, то есть перед курсором, а также
+        в get_autocommit и set_autocommit, с которых начинается
+        transaction.atomic: оборванное соединение нужно заменить до
+        входа в транзакцию, внутри нее закрыть его уже нельзя.
+        """
+        if (
+            self.connection is None
+            or self.reuse_checked
+            or self.in_atomic_block
+        ):
+            return
+        self.reuse_checked = True
+        if (
+            self.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not self.is_usable()
+        ):
+            record('health_check_failed')
+            self.close()
+            return
+        record('acquired')
+        record('reused')
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.reuse_checked = False
+
+
+def is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Error:
+        return False
+    return True
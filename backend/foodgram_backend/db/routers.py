@@ -0,0 +1,55 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY_APPS = ('authtoken', 'sessions')
+
+current_replica = ContextVar('current_replica', default=None)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def use_database(alias):
+    """Чтение внутри блока идет в реплику alias, None — в основную базу."""
+    token = current_replica.set(alias)
+    try:
+        yield
+    finally:
+        current_replica.reset(token)
+
+
+def use_primary():
+    return use_database(None)
+
+
+class ReplicaRouter:
+    """Чтение в реплику, выбранную для запроса, запись в основную базу.
+
+    Реплику выбирает ReplicaMiddleware для безопасных запросов. Внутри
+    транзакции, вне запросов и для токенов и сессий чтение идет в
+    основную базу, миграции применяются только к ней.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = current_replica.get()
+        if (
+            alias is None
+            or model._meta.app_label in PRIMARY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -31,6 +31,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'foodgram_backend.db.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,19 +61,70 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'foodgram_backend.wsgi.application'
+ASGI_APPLICATION = 'foodgram_backend.asgi.application'
+ASGI_ENABLED = os.getenv('ASGI_ENABLED', 'False') == 'True'
 
 
+DB_ENGINE = os.getenv('DB_ENGINE')
+if DB_ENGINE == 'django.db.backends.postgresql':
+    DB_ENGINE = 'foodgram_backend.db.postgresql'
+
 DATABASES = {
     'default': {
-        'ENGINE': os.getenv('DB_ENGINE'),
+        'ENGINE': DB_ENGINE,
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('DB_HOST'),
-        'PORT': os.getenv('DB_PORT')
+        'PORT': os.getenv('DB_PORT'),
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', 0 if ASGI_ENABLED else 60)
+        ),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+        ),
+        'POOL_SIZE': int(os.getenv('DB_POOL_SIZE', 0)),
+        'POOL_TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    }
+}
+
+DB_REPLICA_HOSTS = [
+    host for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host
+]
+DB_REPLICA_NAME = os.getenv('DB_REPLICA_NAME')
+if DB_REPLICA_NAME and not DB_REPLICA_HOSTS:
+    DB_REPLICA_HOSTS = [DATABASES['default']['HOST'] or '']
+for number, host in enumerate(DB_REPLICA_HOSTS, 1):
+    address, _, port = host.partition(':')
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'],
+        NAME=DB_REPLICA_NAME or DATABASES['default']['NAME'],
+        HOST=address,
+        PORT=port or DATABASES['default']['PORT'],
+        TEST={'MIRROR': 'default'},
+    )
+DB_REPLICA_STICKY_SECONDS = int(os.getenv('DB_REPLICA_STICKY_SECONDS', 5))
+DATABASE_ROUTERS = ['foodgram_backend.db.routers.ReplicaRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
     }
 }
 
+API_CACHE_TIMEOUT = int(os.getenv('API_CACHE_TIMEOUT', 600))
+API_CACHE_MAX_AGE = int(os.getenv('API_CACHE_MAX_AGE', 60))
+RECIPE_CARDS_ENABLED = os.getenv('RECIPE_CARDS_ENABLED', 'True') == 'True'
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 60))
+AUTH_TOKEN_SHARED_CACHE = (
+    os.getenv('AUTH_TOKEN_SHARED_CACHE', 'False') == 'True'
+)
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -105,6 +158,13 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+IMAGE_MAX_UPLOAD_SIZE = int(
+    os.getenv('IMAGE_MAX_UPLOAD_SIZE', 5 * 1024 * 1024)
+)
+IMAGE_MAX_DIMENSION = int(os.getenv('IMAGE_MAX_DIMENSION', 4096))
+IMAGE_THUMBNAIL_SIZE = (480, 480)
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
@@ -112,10 +172,45 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ],
 }
 
+INGREDIENT_INDEX_ENABLED = (
+    os.getenv('INGREDIENT_INDEX_ENABLED', 'True') == 'True'
+)
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+RECIPE_SEARCH_INDEX_TTL = int(os.getenv('RECIPE_SEARCH_INDEX_TTL', 300))
+RECIPE_SEARCH_MAX_RESULTS = int(os.getenv('RECIPE_SEARCH_MAX_RESULTS', 1000))
+# Изменения рецептов доходят до индекса через кеш; без общего кеша другие
+# процессы видят их только после перезагрузки.
+COOKING_INDEX_TTL = int(os.getenv(
+    'COOKING_INDEX_TTL',
+    300 if CACHES['default']['BACKEND'].endswith('LocMemCache') else 3600,
+))
+
+FEED_CELEBRITY_FOLLOWERS = int(os.getenv('FEED_CELEBRITY_FOLLOWERS', 5000))
+FEED_FANOUT_BATCH_SIZE = int(os.getenv('FEED_FANOUT_BATCH_SIZE', 1000))
+FEED_BACKFILL_LIMIT = int(os.getenv('FEED_BACKFILL_LIMIT', 50))
+
+RANKING_FAVORITE_WEIGHT = int(os.getenv('RANKING_FAVORITE_WEIGHT', 2))
+RANKING_CART_WEIGHT = int(os.getenv('RANKING_CART_WEIGHT', 1))
+RANKING_HALF_LIFE_HOURS = float(os.getenv('RANKING_HALF_LIFE_HOURS', 72))
+RANKING_EPOCH = os.getenv('RANKING_EPOCH', '2026-01-01')
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_SLOW_REQUEST_MS = int(os.getenv('METRICS_SLOW_REQUEST_MS', 500))
+METRICS_REPEATED_QUERIES = int(os.getenv('METRICS_REPEATED_QUERIES', 10))
+
 DJOSER = {
     'LOGIN_FIELD': 'email',
     'HIDE_USERS': False,
@@ -0,0 +1,12 @@
+import os
+
+asgi = os.getenv('ASGI_ENABLED', 'False') == 'True'
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', 1))
+if asgi:
+    wsgi_app = 'foodgram_backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram_backend.wsgi:application'
+    threads = int(os.getenv('GUNICORN_THREADS', 1))
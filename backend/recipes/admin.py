@@ -36,14 +36,11 @@ class IngredientRecipeInline(TabularInline):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     """Админка рецептов."""
-    list_display = ('id', 'name', 'author', 'favorite_count')
+    list_display = ('id', 'name', 'author', 'favorites_count')
     list_filter = ('name', 'author', 'tags',)
     inlines = (IngredientRecipeInline,)
     empty_value_display = '-пусто-'
 
-    def favorite_count(self, recipe):
-        return Favorite.objects.filter(recipe=recipe).count()
-
 
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
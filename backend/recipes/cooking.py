@@ -0,0 +1,191 @@
+import time
+from array import array
+from collections import Counter, defaultdict
+from itertools import chain
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .indexes import InMemoryIndex
+from .models import IngredientRecipe
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+VERSION_KEY = 'cooking-index:version'
+# Больше изменений с последней синхронизации дешевле перечитать целиком.
+MAX_CHANGES = 1000
+
+
+def change_key(version):
+    return f'cooking-index:change:{version}'
+
+
+def current_version():
+    """Номер последнего изменения рецептов.
+
+    Счетчик начинается со времени в миллисекундах, чтобы после вытеснения
+    из кеша не повторить номера, которые процессы уже видели.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, time.time_ns() // 10 ** 6, None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def count_matches(postings, ids, sizes, ingredient_ids, max_missing):
+    """Тройки (id рецепта, есть, не хватает) для выбранных продуктов.
+
+    С numpy массивы позиций рецептов склеиваются и считаются одним
+    bincount, без него — Counter по тем же массивам.
+    """
+    chunks = [postings[pk] for pk in ingredient_ids if pk in postings]
+    if numpy is None:
+        return [
+            (ids[position], have, sizes[position] - have)
+            for position, have in Counter(chain.from_iterable(chunks)).items()
+            if sizes[position] - have <= max_missing
+        ]
+    if not chunks:
+        return []
+    have = numpy.bincount(
+        numpy.concatenate([
+            numpy.frombuffer(chunk, dtype=numpy.int64) for chunk in chunks
+        ]),
+        minlength=len(sizes),
+    )
+    missing = numpy.frombuffer(sizes, dtype=numpy.int64) - have
+    selected = numpy.flatnonzero((have > 0) & (missing <= max_missing))
+    return list(zip(
+        numpy.frombuffer(ids, dtype=numpy.int64)[selected].tolist(),
+        have[selected].tolist(),
+        missing[selected].tolist(),
+    ))
+
+
+class CookingIndex(InMemoryIndex):
+    """Обратный индекс «ингредиент -> рецепты» для подбора рецептов по
+    продуктам в наличии.
+
+    Рецепты пронумерованы подряд, для каждого ингредиента хранится
+    массив номеров его рецептов, для каждого номера — id рецепта и
+    число ингредиентов. Совпадения считаются без запросов к базе.
+
+    Изменения рецептов публикует publish: номер изменения и id рецептов
+    кладутся в кеш, и каждый процесс перед поиском перечитывает только
+    эти рецепты. С общим CACHE_BACKEND полная перезагрузка нужна лишь
+    после COOKING_INDEX_TTL или пропуска изменений.
+    """
+    ttl_setting = 'COOKING_INDEX_TTL'
+
+    def __init__(self):
+        super().__init__()
+        self.version = 0
+
+    def _load(self):
+        self.version = current_version()
+        postings = defaultdict(lambda: array('q'))
+        positions, recipes = {}, {}
+        ids, sizes = array('q'), array('q')
+        for recipe_id, ingredient_id in (
+            IngredientRecipe.objects.order_by('recipe_id')
+            .values_list('recipe_id', 'ingredient_id')
+            .iterator()
+        ):
+            if recipe_id not in positions:
+                positions[recipe_id] = len(ids)
+                recipes[recipe_id] = set()
+                ids.append(recipe_id)
+                sizes.append(0)
+            if ingredient_id not in recipes[recipe_id]:
+                postings[ingredient_id].append(positions[recipe_id])
+                recipes[recipe_id].add(ingredient_id)
+                sizes[positions[recipe_id]] += 1
+        return dict(postings), positions, recipes, ids, sizes
+
+    def _get_data(self):
+        self.sync()
+        return super()._get_data()
+
+    def publish(self, recipe_ids):
+        """Сообщает всем процессам об изменении рецептов."""
+        recipe_ids = list(recipe_ids)
+        current_version()
+        version = cache.incr(VERSION_KEY)
+        cache.set(change_key(version), recipe_ids, settings.COOKING_INDEX_TTL)
+        self.sync()
+
+    def sync(self):
+        """Применяет изменения, опубликованные после загрузки индекса."""
+        if self._data is None:
+            return
+        version = self.version
+        current = current_version()
+        if current == version:
+            return
+        changes = {}
+        if version < current <= version + MAX_CHANGES:
+            keys = [
+                change_key(number)
+                for number in range(version + 1, current + 1)
+            ]
+            changes = cache.get_many(keys)
+        if len(changes) != current - version:
+            self.invalidate()
+            return
+        self.update_recipes(set(chain.from_iterable(changes.values())))
+        self.version = max(self.version, current)
+
+    def update_recipes(self, recipe_ids):
+        """Перечитывает ингредиенты рецептов одним запросом."""
+        data = self._data
+        if data is None:
+            return
+        _, postings, positions, recipes, ids, sizes = data
+        rows = defaultdict(set)
+        for recipe_id, ingredient_id in IngredientRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'ingredient_id'):
+            rows[recipe_id].add(ingredient_id)
+        with self._lock:
+            for recipe_id in recipe_ids:
+                new = rows.get(recipe_id, set())
+                if recipe_id not in positions:
+                    if not new:
+                        continue
+                    positions[recipe_id] = len(ids)
+                    ids.append(recipe_id)
+                    sizes.append(0)
+                position = positions[recipe_id]
+                old = recipes.pop(recipe_id, set())
+                for ingredient_id in old - new:
+                    postings[ingredient_id].remove(position)
+                for ingredient_id in new - old:
+                    postings.setdefault(
+                        ingredient_id, array('q')
+                    ).append(position)
+                if new:
+                    recipes[recipe_id] = new
+                sizes[position] = len(new)
+
+    def search(self, ingredient_ids, max_missing):
+        """Рецепты, которым не хватает не больше max_missing продуктов.
+
+        Возвращает тройки (id рецепта, есть, не хватает), сначала
+        рецепты с наибольшей долей имеющихся продуктов.
+        """
+        _, postings, _, _, ids, sizes = self._get_data()
+        with self._lock:
+            result = count_matches(
+                postings, ids, sizes, set(ingredient_ids), max_missing
+            )
+        result.sort(key=lambda item: (
+            -item[1] / (item[1] + item[2]), item[2], -item[0]
+        ))
+        return result
+
+
+cooking_index = CookingIndex()
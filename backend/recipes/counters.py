@@ -0,0 +1,64 @@
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Favorite, Recipe
+from users.models import Follow, User
+
+
+def non_negative(field, delta):
+    """F(field) + delta, но не меньше нуля.
+
+    Строки, добавленные в обход сигналов (bulk_create, сырой SQL), в
+    счетчике не учтены; их удаление не должно нарушать CHECK
+    положительного поля. Точное значение восстанавливает recount.
+    """
+    return Greatest(F(field) + delta, 0)
+
+
+def update_recipes_count(author_id, delta):
+    User.objects.filter(pk=author_id).update(
+        recipes_count=non_negative('recipes_count', delta)
+    )
+
+
+def update_followers_count(author_id, delta):
+    User.objects.filter(pk=author_id).update(
+        followers_count=non_negative('followers_count', delta)
+    )
+
+
+def count_subquery(queryset, field):
+    """Количество строк queryset для каждой строки внешнего запроса."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        Value(0),
+    )
+
+
+def recount(queryset, counter, related, field):
+    """Исправляет расхождения счетчика и возвращает число исправленных."""
+    actual = count_subquery(related, field)
+    return queryset.exclude(**{counter: actual}).update(**{counter: actual})
+
+
+def recount_all():
+    return {
+        'favorites_count': recount(
+            Recipe.objects.all(), 'favorites_count',
+            Favorite.objects.all(), 'recipe',
+        ),
+        'recipes_count': recount(
+            User.objects.all(), 'recipes_count',
+            Recipe.objects.all(), 'author',
+        ),
+        'followers_count': recount(
+            User.objects.all(), 'followers_count',
+            Follow.objects.all(), 'author',
+        ),
+    }
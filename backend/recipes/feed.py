@@ -0,0 +1,98 @@
+from itertools import islice
+
+from django.conf import settings
+
+from .models import FeedEntry, Recipe
+from users.models import Follow, User
+
+
+def celebrity_ids():
+    """Авторы, чьи рецепты не копируются в ленты, а читаются при запросе."""
+    return User.objects.filter(
+        followers_count__gte=settings.FEED_CELEBRITY_FOLLOWERS
+    ).values('pk')
+
+
+def is_celebrity(author_id):
+    return celebrity_ids().filter(pk=author_id).exists()
+
+
+def create_entries(rows):
+    """Пишет записи (подписчик, рецепт, автор, дата) пачками."""
+    rows = iter(rows)
+    created = 0
+    while True:
+        batch = [
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author_id=author_id,
+                pub_date=pub_date,
+            )
+            for user_id, recipe_id, author_id, pub_date in islice(
+                rows, settings.FEED_FANOUT_BATCH_SIZE
+            )
+        ]
+        if not batch:
+            return created
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+        created += len(batch)
+
+
+def fan_out(recipe):
+    """Копирует новый рецепт в ленты подписчиков автора."""
+    if is_celebrity(recipe.author_id):
+        return 0
+    followers = Follow.objects.filter(
+        author_id=recipe.author_id
+    ).values_list('user_id', flat=True).iterator()
+    return create_entries(
+        (user_id, recipe.pk, recipe.author_id, recipe.pub_date)
+        for user_id in followers
+    )
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    if is_celebrity(author_id):
+        return 0
+    recipes = Recipe.objects.filter(author_id=author_id).values_list(
+        'pk', 'pub_date'
+    )[:settings.FEED_BACKFILL_LIMIT]
+    return create_entries(
+        (user_id, recipe_id, author_id, pub_date)
+        for recipe_id, pub_date in recipes
+    )
+
+
+def remove(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild():
+    """Пересобирает все ленты по текущим подпискам."""
+    FeedEntry.objects.all().delete()
+    created = 0
+    for user_id, author_id in Follow.objects.exclude(
+        author__in=celebrity_ids()
+    ).values_list('user_id', 'author_id').iterator():
+        created += backfill(user_id, author_id)
+    return created
+
+
+def feed_sources(user):
+    """Источники ленты для FeedPagination.
+
+    Записи ленты и рецепты популярных авторов, на которых подписан
+    пользователь; у каждого источника свое поле id рецепта.
+    """
+    return [
+        (FeedEntry.objects.filter(user=user), 'recipe_id'),
+        (
+            Recipe.objects.filter(
+                author__in=celebrity_ids(),
+                author__following__user=user,
+            ),
+            'id',
+        ),
+    ]
@@ -0,0 +1,104 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.dispatch import Signal
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_DIR = 'recipes/images/variants/'
+THUMBNAIL_SUFFIX = 'thumb.jpg'
+WEBP_SUFFIX = 'full.webp'
+
+executor = None
+
+image_processed = Signal()
+
+
+def variant_name(name, suffix):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{VARIANTS_DIR}{stem}_{suffix}'
+
+
+def has_current_variants(recipe):
+    return (
+        recipe.image_thumbnail.name
+        == variant_name(recipe.image.name, THUMBNAIL_SUFFIX)
+    )
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return executor
+
+
+def schedule_image_processing(recipe_id):
+    """Ставит обработку картинки рецепта в фоновый пул потоков.
+
+    При IMAGE_WORKERS = 0 картинка обрабатывается сразу.
+    """
+    if settings.IMAGE_WORKERS:
+        get_executor().submit(process_in_worker, recipe_id)
+    else:
+        process_recipe_image(recipe_id)
+
+
+def process_in_worker(recipe_id):
+    try:
+        process_recipe_image(recipe_id)
+    finally:
+        connection.close()
+
+
+def save_image(storage, name, image, format, **options):
+    buffer = BytesIO()
+    image.save(buffer, format=format, **options)
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def process_recipe_image(recipe_id):
+    """Убирает EXIF из оригинала и создает миниатюру и WebP."""
+    try:
+        recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+        if recipe is None or not recipe.image:
+            return
+        name = recipe.image.name
+        storage = recipe.image.storage
+        with storage.open(name) as file:
+            original = Image.open(file)
+            original.load()
+        image = ImageOps.exif_transpose(original)
+        if original.getexif():
+            save_image(storage, name, image, original.format)
+        rgb = image if image.mode == 'RGB' else image.convert('RGB')
+        thumbnail = rgb.copy()
+        thumbnail.thumbnail(settings.IMAGE_THUMBNAIL_SIZE)
+        Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image_thumbnail=save_image(
+                storage, variant_name(name, THUMBNAIL_SUFFIX),
+                thumbnail, 'JPEG', quality=85, optimize=True,
+            ),
+            image_webp=save_image(
+                storage, variant_name(name, WEBP_SUFFIX),
+                image, 'WEBP', quality=80,
+            ),
+        )
+        image_processed.send(sender=Recipe, recipe_id=recipe_id)
+    except Exception:
+        logger.exception(
+            'Не удалось обработать картинку рецепта %s', recipe_id
+        )
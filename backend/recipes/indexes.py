@@ -0,0 +1,35 @@
+import threading
+import time
+
+from django.conf import settings
+
+
+class InMemoryIndex:
+    """Индекс в памяти процесса.
+
+    Данные строятся лениво методом _load и перечитываются не реже, чем
+    раз в столько секунд, сколько задано в настройке ttl_setting
+    подкласса, чтобы другие процессы тоже увидели изменения.
+    invalidate сбрасывает их сразу.
+    """
+    ttl_setting = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def invalidate(self):
+        self._data = None
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _get_data(self):
+        data = self._data
+        ttl = getattr(settings, self.ttl_setting)
+        if data is None or time.monotonic() - data[0] > ttl:
+            with self._lock:
+                data = self._data
+                if data is None or time.monotonic() - data[0] > ttl:
+                    data = self._data = (time.monotonic(), *self._load())
+        return data
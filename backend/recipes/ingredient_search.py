@@ -0,0 +1,43 @@
+from bisect import bisect_left
+
+from .indexes import InMemoryIndex
+from .models import Ingredient
+
+PREFIX_END = chr(0x10FFFF)
+
+
+class IngredientIndex(InMemoryIndex):
+    """Индекс ингредиентов в памяти процесса.
+
+    Справочник небольшой и почти не меняется, поэтому он целиком
+    держится в памяти отсортированным по названию в нижнем регистре.
+    Поиск по префиксу идет бинарным поиском, без обращения к базе.
+    Индекс сбрасывается сигналами при изменении ингредиентов.
+    """
+    ttl_setting = 'INGREDIENT_INDEX_TTL'
+
+    def _load(self):
+        ingredients = sorted(
+            Ingredient.objects.all(),
+            key=lambda ingredient: (ingredient.name.casefold(), ingredient.id)
+        )
+        keys = [ingredient.name.casefold() for ingredient in ingredients]
+        return keys, ingredients
+
+    def search(self, name):
+        """Сначала совпадения по началу названия, затем по подстроке."""
+        _, keys, ingredients = self._get_data()
+        query = name.casefold()
+        start = bisect_left(keys, query)
+        end = bisect_left(keys, query + PREFIX_END, start)
+        result = ingredients[start:end]
+        if query:
+            result.extend(
+                ingredient
+                for key, ingredient in zip(keys, ingredients)
+                if query in key and not key.startswith(query)
+            )
+        return result
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,156 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from .ingredient_search import ingredient_index
+from .models import Ingredient, Tag
+
+INGREDIENT_MODEL = 'recipes.ingredient'
+TAG_MODEL = 'recipes.tag'
+
+# bulk_create и COPY не отправляют post_save; sender — модель.
+catalogue_loaded = Signal()
+
+
+def read_csv_ingredients(path):
+    """Строки CSV вида «название,единица измерения»."""
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) >= 2:
+                yield {'name': row[0], 'measurement_unit': row[1]}
+
+
+def read_json_objects(path):
+    """Объекты JSON: фикстура Django или список словарей с полями.
+
+    Возвращает пары (модель, поля); у записей без модели она пустая.
+    """
+    with open(path, encoding='utf-8') as file:
+        objects = json.load(file)
+    for obj in objects:
+        if 'fields' in obj:
+            fields = dict(obj['fields'])
+            if 'pk' in obj:
+                fields['id'] = obj['pk']
+            yield obj.get('model'), fields
+        else:
+            yield None, obj
+
+
+def read_ingredients(path):
+    if str(path).endswith('.csv'):
+        return read_csv_ingredients(path)
+    return (
+        fields for model, fields in read_json_objects(path)
+        if model in (None, INGREDIENT_MODEL)
+    )
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        yield batch
+
+
+def unique_ingredients(rows):
+    """Отбрасывает ингредиенты, которые уже есть в базе или в файле."""
+    seen = set(Ingredient.objects.values_list('name', 'measurement_unit'))
+    for row in rows:
+        key = (row['name'].strip(), row['measurement_unit'].strip())
+        if not all(key) or key in seen:
+            continue
+        seen.add(key)
+        yield {
+            'id': row.get('id'),
+            'name': key[0],
+            'measurement_unit': key[1],
+        }
+
+
+def copy_ingredients(batch):
+    """Быстрая загрузка через COPY во временную таблицу (PostgreSQL)."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in batch:
+        writer.writerow((
+            '' if row['id'] is None else row['id'],
+            row['name'],
+            row['measurement_unit'],
+        ))
+    buffer.seek(0)
+    table = Ingredient._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMP TABLE IF NOT EXISTS ingredient_load '
+            '(id bigint, name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY ingredient_load (id, name, measurement_unit) '
+            "FROM STDIN WITH (FORMAT csv, NULL '')",
+            buffer,
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (id, name, measurement_unit) '
+            f"SELECT COALESCE(id, nextval(pg_get_serial_sequence("
+            f"'{table}', 'id'))), name, measurement_unit "
+            'FROM ingredient_load ON CONFLICT DO NOTHING'
+        )
+        cursor.execute('TRUNCATE ingredient_load')
+
+
+def create_ingredients(batch):
+    Ingredient.objects.bulk_create(
+        [Ingredient(**row) for row in batch], ignore_conflicts=True
+    )
+
+
+def reset_sequences(*models):
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def load_ingredients(rows, batch_size=1000, use_copy=True):
+    """Загружает ингредиенты пачками и возвращает число новых строк."""
+    before = Ingredient.objects.count()
+    use_copy = use_copy and connection.vendor == 'postgresql'
+    with transaction.atomic():
+        for batch in batches(unique_ingredients(rows), batch_size):
+            if use_copy:
+                copy_ingredients(batch)
+            else:
+                create_ingredients(batch)
+        reset_sequences(Ingredient)
+        catalogue_loaded.send(sender=Ingredient)
+    ingredient_index.invalidate()
+    return Ingredient.objects.count() - before
+
+
+def load_tags(rows, batch_size=1000):
+    """Загружает теги и возвращает число новых строк."""
+    before = Tag.objects.count()
+    seen = set(Tag.objects.values_list('slug', flat=True))
+    tags = []
+    for row in rows:
+        if row['slug'] in seen:
+            continue
+        seen.add(row['slug'])
+        tags.append(Tag(**row))
+    with transaction.atomic():
+        Tag.objects.bulk_create(
+            tags, batch_size=batch_size, ignore_conflicts=True
+        )
+        reset_sequences(Tag)
+        catalogue_loaded.send(sender=Tag)
+    return Tag.objects.count() - before
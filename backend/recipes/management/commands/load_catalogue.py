@@ -0,0 +1,52 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.loaders import (
+    INGREDIENT_MODEL,
+    TAG_MODEL,
+    load_ingredients,
+    load_tags,
+    read_json_objects,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает теги и ингредиенты из фикстуры JSON. '
+        'Остальные модели пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.BASE_DIR / 'ingredients.json',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-copy', action='store_true')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        objects = {INGREDIENT_MODEL: [], TAG_MODEL: []}
+        skipped = 0
+        for model, fields in read_json_objects(options['path']):
+            if model in objects:
+                objects[model].append(fields)
+            else:
+                skipped += 1
+        tags = load_tags(objects[TAG_MODEL], options['batch_size'])
+        ingredients = load_ingredients(
+            objects[INGREDIENT_MODEL],
+            batch_size=options['batch_size'],
+            use_copy=not options['no_copy'],
+        )
+        elapsed = time.monotonic() - started
+        total = len(objects[TAG_MODEL]) + len(objects[INGREDIENT_MODEL])
+        self.stdout.write(self.style.SUCCESS(
+            f'Добавлено тегов: {tags}, ингредиентов: {ingredients}, '
+            f'пропущено записей других моделей: {skipped}. '
+            f'{total} строк за {elapsed:.2f} с '
+            f'({total / max(elapsed, 1e-6):.0f} строк/с).'
+        ))
@@ -0,0 +1,51 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from recipes.loaders import load_ingredients, read_ingredients
+
+
+class Counter:
+    """Считает строки, прошедшие через генератор."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            yield row
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты из CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=settings.BASE_DIR / 'data' / 'ingredients.csv',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rows = Counter(read_ingredients(options['path']))
+        created = load_ingredients(
+            rows,
+            batch_size=options['batch_size'],
+            use_copy=not options['no_copy'],
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано {rows.count}, добавлено {created} ингредиентов '
+            f'за {elapsed:.2f} с ({rows.count / max(elapsed, 1e-6):.0f} '
+            'строк/с).'
+        ))
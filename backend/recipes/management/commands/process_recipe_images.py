@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import has_current_variants, process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры и WebP для картинок рецептов без них.'
+
+    def handle(self, *args, **options):
+        processed = 0
+        recipes = Recipe.objects.exclude(image='').only(
+            'image', 'image_thumbnail'
+        )
+        for recipe in recipes.iterator():
+            if not has_current_variants(recipe):
+                process_recipe_image(recipe.pk)
+                processed += 1
+        self.stdout.write(f'Обработано картинок: {processed}')
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from recipes.ranking import (
+    current_epoch,
+    rebase,
+    recompute_popularity,
+    recompute_trending,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает popularity и trending_score рецептов по строкам '
+        'избранного и списка покупок. Исправляет расхождения после '
+        'удалений в обход API и после смены весов или периода '
+        'полураспада; при необходимости переносит точку отсчета '
+        'trending_score.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if rebase():
+            self.stdout.write(
+                'trending_score: точка отсчета перенесена на '
+                f'{current_epoch():%Y-%m-%d %H:%M}'
+            )
+        self.stdout.write(
+            f'popularity: исправлено строк {recompute_popularity()}'
+        )
+        fixed = recompute_trending(options['batch_size'])
+        self.stdout.write(f'trending_score: исправлено строк {fixed}')
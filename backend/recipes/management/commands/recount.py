@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import recount_all
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сохраненные счетчики избранного, '
+        'рецептов и подписчиков.'
+    )
+
+    def handle(self, *args, **options):
+        for counter, fixed in recount_all().items():
+            self.stdout.write(f'{counter}: исправлено строк {fixed}')
@@ -0,0 +1,96 @@
+# Generated by Django 3.2.16 on 2026-10-18 20:52
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import (
+    Count, ExpressionWrapper, FloatField, OuterRef, Subquery, Value,
+)
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        Value(0),
+    )
+
+
+def fill_rankings(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Favorite = apps.get_model('recipes', 'Favorite')
+    ShoppingCart = apps.get_model('recipes', 'ShoppingCart')
+    epoch = datetime.fromisoformat(settings.RANKING_EPOCH).replace(
+        tzinfo=timezone.utc
+    )
+    popularity = Value(0)
+    score = Value(0.0)
+    for model, weight in (
+        (Favorite, settings.RANKING_FAVORITE_WEIGHT),
+        (ShoppingCart, settings.RANKING_CART_WEIGHT),
+    ):
+        # У всех старых строк одинаковое added_at — время миграции.
+        added_at = model.objects.values_list('added_at', flat=True).first()
+        if added_at is None:
+            continue
+        factor = weight * 2 ** min(
+            (added_at - epoch).total_seconds()
+            / (settings.RANKING_HALF_LIFE_HOURS * 3600),
+            960,
+        )
+        count = count_subquery(model, 'recipe')
+        popularity = popularity + count * weight
+        score = score + count * factor
+    Recipe.objects.update(
+        popularity=popularity,
+        trending_score=ExpressionWrapper(score, output_field=FloatField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_feed_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity',
+            field=models.PositiveIntegerField(default=0, verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, verbose_name='Рейтинг набирающих популярность'),
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_score_idx'),
+        ),
+        migrations.RunPython(fill_rankings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.16 on 2026-10-18 21:42
+
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_epoch(apps, schema_editor):
+    # Оценки из 0011_ranking отсчитаны от RANKING_EPOCH.
+    apps.get_model('recipes', 'RankingEpoch').objects.create(
+        pk=1,
+        epoch=datetime.fromisoformat(settings.RANKING_EPOCH).replace(
+            tzinfo=timezone.utc
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RankingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('epoch', models.DateTimeField(verbose_name='Точка отсчета')),
+            ],
+            options={
+                'verbose_name': 'Точка отсчета рейтинга',
+                'verbose_name_plural': 'Точка отсчета рейтинга',
+            },
+        ),
+        migrations.RunPython(create_epoch, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,16 @@
-from django.db import models
-from django.db.models import UniqueConstraint
+from django.contrib.postgres.search import SearchVectorField
+from django.db import connections, models
+from django.db.models import (
+    BooleanField,
+    Exists,
+    OuterRef,
+    Prefetch,
+    UniqueConstraint,
+    Value,
+)
+from django.utils import timezone
 
-from users.models import User
+from users.models import Follow, User
 
 
 class Ingredient(models.Model):
@@ -15,6 +24,12 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        constraints = [
+            UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient'
+            )
+        ]
 
     def __str__(self):
         return self.name
@@ -46,6 +61,88 @@ class Tag(models.Model):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+    """Кверисет рецептов."""
+    search_ranks = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.search_ranks = self.search_ranks
+        return clone
+
+    def order_by(self, *field_names):
+        clone = super().order_by(*field_names)
+        clone.search_ranks = None
+        return clone
+
+    def with_search_ranks(self, ranks):
+        """Только рецепты из ranks (id -> ранг поиска).
+
+        Для баз без полнотекстового поиска: ранги не попадают в SQL, по
+        ним сортирует RecipePagination. Явная сортировка order_by их
+        отменяет.
+        """
+        queryset = self.filter(pk__in=ranks)
+        queryset.search_ranks = ranks
+        return queryset
+
+    def with_flags(self, user):
+        """Флаги пользователя без связанных данных: в избранном, в
+        корзине и подписан ли он на автора."""
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+                is_author_subscribed=Value(
+                    False, output_field=BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_author_subscribed=Exists(Follow.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+
+    def with_user_data(self, user):
+        """Подгружает связанные данные и флаги пользователя одним набором
+        запросов, не зависящим от количества рецептов."""
+        authors = User.objects.all()
+        if user.is_authenticated:
+            authors = authors.annotate(is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+            queryset = self.annotate(
+                is_favorited=Exists(Favorite.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+                is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )),
+            )
+        else:
+            authors = authors.annotate(
+                is_subscribed=Value(False, output_field=BooleanField())
+            )
+            queryset = self.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors),
+            'tags',
+            Prefetch(
+                'ingredientrecipe_set',
+                queryset=IngredientRecipe.objects.select_related('ingredient'),
+            ),
+        )
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
     author = models.ForeignKey(
@@ -62,6 +159,16 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Картинка'
     )
+    image_thumbnail = models.ImageField(
+        upload_to='recipes/images/variants/',
+        blank=True,
+        verbose_name='Миниатюра'
+    )
+    image_webp = models.ImageField(
+        upload_to='recipes/images/variants/',
+        blank=True,
+        verbose_name='Картинка WebP'
+    )
     text = models.TextField(verbose_name='Описание блюда')
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -81,16 +188,69 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='В избранном',
+    )
+    popularity = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Популярность',
+    )
+    trending_score = models.FloatField(
+        default=0,
+        verbose_name='Рейтинг набирающих популярность',
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('-pub_date',)
+        ordering = ('-pub_date', '-id')
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-popularity', '-id'],
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_score_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class RankingEpoch(models.Model):
+    """Точка отсчета trending_score.
+
+    Одна строка. Оценки хранятся относительно нее, ranking.rebase
+    переносит ее вперед вместе с оценками.
+    """
+    epoch = models.DateTimeField(verbose_name='Точка отсчета')
+
+    class Meta:
+        verbose_name = 'Точка отсчета рейтинга'
+        verbose_name_plural = 'Точка отсчета рейтинга'
+
+    def __str__(self):
+        return f'{self.epoch:%Y-%m-%d %H:%M}'
+
+
 class IngredientRecipe(models.Model):
     """Количество ингредиентов."""
     ingredient = models.ForeignKey(
@@ -117,6 +277,65 @@ class IngredientRecipe(models.Model):
         return f'{self.recipe}: {self.ingredient} - {self.amount}'
 
 
+class UserRecipeQuerySet(models.QuerySet):
+    """Кверисет избранного и списка покупок.
+
+    add и remove меняют строки одним запросом с RETURNING и возвращают
+    пары (id рецепта, added_at) только тех строк, которые действительно
+    вставил или удалил этот запрос. Параллельный запрос с теми же
+    рецептами получит пустой список, поэтому оценки и счетчики не
+    учитываются дважды.
+    """
+
+    def execute(self, sql, params):
+        connection = connections[self.db]
+        field = self.model._meta.get_field('added_at')
+        converters = connection.ops.get_db_converters(
+            field.get_col(self.model._meta.db_table)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        result = []
+        for recipe_id, added_at in rows:
+            for converter in converters:
+                added_at = converter(added_at, field, connection)
+            result.append((recipe_id, added_at))
+        return result
+
+    def add(self, user, recipe_ids):
+        """Добавляет существующие рецепты, которых еще нет у user."""
+        if not recipe_ids:
+            return []
+        connection = connections[self.db]
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        return self.execute(
+            f'INSERT INTO {self.model._meta.db_table} '
+            '(user_id, recipe_id, added_at) '
+            f'SELECT %s, id, %s FROM {Recipe._meta.db_table} '
+            f'WHERE id IN ({placeholders}) '
+            'ON CONFLICT (user_id, recipe_id) DO NOTHING '
+            'RETURNING recipe_id, added_at',
+            [
+                user.pk,
+                connection.ops.adapt_datetimefield_value(timezone.now()),
+                *recipe_ids,
+            ],
+        )
+
+    def remove(self, user, recipe_ids):
+        """Удаляет рецепты из списка user."""
+        if not recipe_ids:
+            return []
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        return self.execute(
+            f'DELETE FROM {self.model._meta.db_table} '
+            f'WHERE user_id = %s AND recipe_id IN ({placeholders}) '
+            'RETURNING recipe_id, added_at',
+            [user.pk, *recipe_ids],
+        )
+
+
 class Favorite(models.Model):
     """Модель избранного."""
     user = models.ForeignKey(
@@ -131,6 +350,12 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    added_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
+    )
+
+    objects = UserRecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Избранное'
@@ -141,6 +366,12 @@ class Favorite(models.Model):
                 name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в Избранное'
@@ -160,6 +391,12 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт',
     )
+    added_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата добавления',
+    )
+
+    objects = UserRecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Список покупок'
@@ -170,6 +407,62 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='shopping_cart_recipe_user_idx'
+            )
+        ]
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в cписок покупок'
+
+
+class FeedEntry(models.Model):
+    """Запись ленты подписок.
+
+    Рецепт автора копируется в ленты его подписчиков при публикации,
+    поэтому лента читается по одному индексу без соединения с подписками.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} в ленте {self.user}'
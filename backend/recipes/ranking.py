@@ -0,0 +1,185 @@
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils.timezone import now
+
+from .counters import count_subquery, non_negative
+from .models import Favorite, RankingEpoch, Recipe, ShoppingCart
+
+logger = logging.getLogger(__name__)
+
+# 2 ** 1024 не помещается во float; запас оставлен на сумму вкладов.
+MAX_EXPONENT = 960
+# Через столько периодов полураспада точка отсчета переносится вперед.
+REBASE_EXPONENT = 480
+
+
+def default_epoch():
+    return datetime.fromisoformat(settings.RANKING_EPOCH).replace(
+        tzinfo=timezone.utc
+    )
+
+
+def current_epoch():
+    """Точка отсчета trending_score из RankingEpoch.
+
+    В транзакции на Postgres строка блокируется FOR SHARE до ее конца:
+    rebase дождется записи вкладов, посчитанных от старой точки, и
+    пересчитает их вместе с остальными.
+    """
+    if connection.vendor == 'postgresql' and connection.in_atomic_block:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT epoch FROM {RankingEpoch._meta.db_table} '
+                'WHERE id = 1 FOR SHARE'
+            )
+            row = cursor.fetchone()
+        epoch = row and row[0]
+    else:
+        epoch = RankingEpoch.objects.filter(pk=1).values_list(
+            'epoch', flat=True
+        ).first()
+    return epoch or default_epoch()
+
+
+def weight(model):
+    if model is Favorite:
+        return settings.RANKING_FAVORITE_WEIGHT
+    return settings.RANKING_CART_WEIGHT
+
+
+def half_lives(moment, start):
+    """Число периодов полураспада от start до moment."""
+    seconds = (moment - start).total_seconds()
+    return seconds / (settings.RANKING_HALF_LIFE_HOURS * 3600)
+
+
+def decayed(model, added_at, start):
+    """Вклад строки избранного или списка покупок в trending_score.
+
+    Вес растет вдвое каждые RANKING_HALF_LIFE_HOURS от точки отсчета
+    start. Это равносильно затуханию старых добавлений: порядок рецептов
+    по сумме такой же, как по сумме весов, затухших к текущему моменту,
+    и хранимые оценки не нужно пересчитывать со временем. Точку отсчета
+    переносит rebase; если он не успел и показатель дошел до
+    MAX_EXPONENT, вклад ограничивается с предупреждением в лог.
+    """
+    exponent = half_lives(added_at, start)
+    if exponent > MAX_EXPONENT:
+        logger.warning(
+            'trending_score: с точки отсчета %s прошло %.0f периодов '
+            'полураспада, вклад ограничен', start, exponent
+        )
+        exponent = MAX_EXPONENT
+    return weight(model) * 2 ** exponent
+
+
+def rebase(moment=None):
+    """Переносит точку отсчета trending_score на moment.
+
+    Срабатывает, когда с прошлой точки прошло REBASE_EXPONENT периодов
+    полураспада. В одной транзакции с переносом оценки делятся на
+    2 ** (число периодов), порядок рецептов не меняется. Если точка
+    отстала больше чем на MAX_EXPONENT периодов, часть вкладов могла
+    быть ограничена, и оценки считаются заново. Возвращает True, если
+    точка перенесена.
+    """
+    moment = moment or now()
+    with transaction.atomic():
+        state, _ = RankingEpoch.objects.select_for_update().get_or_create(
+            pk=1, defaults={'epoch': default_epoch()}
+        )
+        shift = half_lives(moment, state.epoch)
+        if shift < REBASE_EXPONENT:
+            return False
+        state.epoch = moment
+        state.save(update_fields=['epoch'])
+        if shift > MAX_EXPONENT:
+            recompute_trending()
+        else:
+            Recipe.objects.update(
+                trending_score=F('trending_score') * 2 ** -shift
+            )
+    return True
+
+
+def update_scores(model, rows, delta):
+    """Учитывает добавленные (delta=1) или удаленные (delta=-1) строки.
+
+    rows — пары (id рецепта, added_at). Для избранного заодно меняется
+    favorites_count. Рецепты с одинаковым изменением обновляются одним
+    запросом; значения не опускаются ниже нуля, если строки добавлены
+    в обход API. Когда точку отсчета пора переносить, rebase
+    выполняется после фиксации транзакции.
+    """
+    if not rows:
+        return
+    changes = defaultdict(lambda: [0, 0.0])
+    start = current_epoch()
+    for recipe_id, added_at in rows:
+        change = changes[recipe_id]
+        change[0] += 1
+        change[1] += decayed(model, added_at, start)
+    groups = defaultdict(list)
+    for recipe_id, change in changes.items():
+        groups[tuple(change)].append(recipe_id)
+    for (count, score), recipe_ids in groups.items():
+        fields = {
+            'popularity': non_negative(
+                'popularity', delta * count * weight(model)
+            ),
+            'trending_score': Greatest(
+                F('trending_score') + delta * score, 0.0
+            ),
+        }
+        if model is Favorite:
+            fields['favorites_count'] = non_negative(
+                'favorites_count', delta * count
+            )
+        Recipe.objects.filter(pk__in=recipe_ids).update(**fields)
+    if half_lives(now(), start) >= REBASE_EXPONENT:
+        transaction.on_commit(rebase)
+
+
+def recompute_popularity():
+    """Пересчитывает popularity, возвращает число исправленных рецептов."""
+    actual = (
+        count_subquery(Favorite.objects.all(), 'recipe')
+        * settings.RANKING_FAVORITE_WEIGHT
+        + count_subquery(ShoppingCart.objects.all(), 'recipe')
+        * settings.RANKING_CART_WEIGHT
+    )
+    return Recipe.objects.exclude(popularity=actual).update(
+        popularity=actual
+    )
+
+
+def recompute_trending(batch_size=1000, tolerance=1e-9):
+    """Пересчитывает trending_score по строкам избранного и покупок.
+
+    Сохраняет только оценки, отличающиеся больше чем на tolerance от
+    суммы, и возвращает их число.
+    """
+    start = current_epoch()
+    scores = defaultdict(float)
+    for model in (Favorite, ShoppingCart):
+        rows = model.objects.values_list('recipe_id', 'added_at').order_by()
+        for recipe_id, added_at in rows.iterator(chunk_size=batch_size):
+            scores[recipe_id] += decayed(model, added_at, start)
+    changed = [
+        Recipe(pk=pk, trending_score=scores.get(pk, 0.0))
+        for pk, current in Recipe.objects.values_list(
+            'pk', 'trending_score'
+        ).iterator(chunk_size=batch_size)
+        if abs(current - scores.get(pk, 0.0))
+        > tolerance * max(abs(current), scores.get(pk, 0.0), 1)
+    ]
+    Recipe.objects.bulk_update(
+        changed, ['trending_score'], batch_size=batch_size
+    )
+    return len(changed)
@@ -0,0 +1,225 @@
+import heapq
+import math
+import re
+import struct
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection
+from django.db.models import F, FloatField, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+
+from .indexes import InMemoryIndex
+from .models import IngredientRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+WORD = re.compile(r'\w+')
+# Ограничения tsvector: наибольшая позиция слова и число его позиций.
+MAX_POSITION = 16383
+MAX_POSITIONS = 256
+ENDINGS = sorted(
+    (
+        'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+        'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ом',
+        'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ую', 'юю', 'ию', 'ия',
+        'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+    ),
+    key=len,
+    reverse=True,
+)
+
+
+def use_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def stem(word):
+    """Грубая основа русского слова: отбрасывает частые окончания."""
+    word = word.casefold().replace('ё', 'е')
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def terms(text):
+    return [stem(word) for word in WORD.findall(text or '')]
+
+
+def search_vector():
+    """Вектор рецепта: название (A), ингредиенты (B), описание (C)."""
+    ingredient_names = Subquery(
+        IngredientRecipe.objects.filter(recipe=OuterRef('pk'))
+        .order_by()
+        .values('recipe')
+        .annotate(names=StringAgg('ingredient__name', ' '))
+        .values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(
+            Coalesce(ingredient_names, Value('')),
+            weight='B',
+            config=SEARCH_CONFIG,
+        )
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipe_ids=None):
+    """Пересчитывает search_vector. Без Postgres сбрасывает индекс."""
+    if not use_postgres():
+        recipe_index.invalidate()
+        return
+    recipes = Recipe.objects.all()
+    if recipe_ids is not None:
+        recipes = recipes.filter(pk__in=recipe_ids)
+    recipes.update(search_vector=search_vector())
+
+
+def field_positions(fields):
+    """Позиции основ слов в полях (вес, текст), как в tsvector.
+
+    Позиции каждого поля сдвинуты на наибольшую позицию предыдущих, как
+    при сложении tsvector оператором ||.
+    """
+    positions = defaultdict(list)
+    offset = 0
+    for weight, value in fields:
+        words = terms(value)
+        for position, term in enumerate(words, offset + 1):
+            if len(positions[term]) < MAX_POSITIONS:
+                positions[term].append(
+                    (min(position, MAX_POSITION), WEIGHTS[weight])
+                )
+        if words:
+            offset = min(offset + len(words), MAX_POSITION)
+    return positions
+
+
+def word_distance(distance):
+    if distance > 100:
+        return 1e-30
+    return 1 / (1.005 + 0.05 * math.exp(distance / 1.5 - 2))
+
+
+def rank_or(entries):
+    """ts_rank для одного слова: calc_rank_or из Postgres."""
+    rank = 0.0
+    for positions in entries:
+        total, top, top_index = 0.0, -1.0, 0
+        for index, (_, weight) in enumerate(positions):
+            total += weight / (index + 1) ** 2
+            if weight > top:
+                top, top_index = weight, index
+        rank += (top + total - top / (top_index + 1) ** 2) / 1.64493406685
+    return rank / len(entries)
+
+
+def rank_and(entries):
+    """ts_rank для нескольких слов: calc_rank_and из Postgres.
+
+    Чем ближе друг к другу слова запроса, тем выше ранг.
+    """
+    if len(entries) < 2:
+        return rank_or(entries)
+    rank = -1.0
+    for index, right in enumerate(entries):
+        for left in entries[:index]:
+            for position, weight in left:
+                for other_position, other_weight in right:
+                    distance = abs(position - other_position)
+                    if not distance:
+                        continue
+                    current = math.sqrt(
+                        weight * other_weight * word_distance(distance)
+                    )
+                    rank = current if rank < 0 else (
+                        1 - (1 - rank) * (1 - current)
+                    )
+    return rank if rank >= 0 else 1e-20
+
+
+def to_real(value):
+    """Округление до real, в котором ts_rank возвращает ранг."""
+    return struct.unpack('f', struct.pack('f', value))[0]
+
+
+class RecipeSearchIndex(InMemoryIndex):
+    """Обратный индекс рецептов в памяти для баз без полнотекстового
+    поиска.
+
+    Находит рецепты со всеми словами запроса и ранжирует их по формуле
+    ts_rank с весами полей и позициями слов. Основы слов выделяются
+    проще, чем стеммером Postgres, и стоп-слова не отбрасываются,
+    поэтому ранги совпадают с Postgres, только когда совпадают основы.
+    """
+    ttl_setting = 'RECIPE_SEARCH_INDEX_TTL'
+
+    def _load(self):
+        ingredients = defaultdict(list)
+        for pk, name in IngredientRecipe.objects.order_by(
+            'recipe_id', 'id'
+        ).values_list('recipe_id', 'ingredient__name'):
+            ingredients[pk].append(name)
+        postings = defaultdict(dict)
+        for pk, name, text in Recipe.objects.values_list(
+            'pk', 'name', 'text'
+        ):
+            positions = field_positions((
+                ('A', name),
+                ('B', ' '.join(ingredients[pk])),
+                ('C', text),
+            ))
+            for term, term_positions in positions.items():
+                postings[term][pk] = tuple(term_positions)
+        return (dict(postings),)
+
+    def search(self, query, limit=None):
+        """Ранги рецептов, содержащих все слова запроса.
+
+        С limit возвращает только столько рецептов с наибольшим рангом.
+        """
+        _, postings = self._get_data()
+        query_terms = set(terms(query))
+        if not query_terms:
+            return {}
+        matches = [postings.get(term, {}) for term in query_terms]
+        ranks = {
+            pk: to_real(rank_and([match[pk] for match in matches]))
+            for pk in set.intersection(*(set(match) for match in matches))
+        }
+        if limit is not None and len(ranks) > limit:
+            ranks = {
+                pk: ranks[pk] for pk in heapq.nlargest(
+                    limit, ranks, key=lambda pk: (ranks[pk], pk)
+                )
+            }
+        return ranks
+
+
+recipe_index = RecipeSearchIndex()
+
+
+def search_recipes(queryset, query):
+    """Рецепты по запросу, от более релевантных к менее.
+
+    В Postgres ранг вычисляется в запросе. Без него совпадения
+    ограничены RECIPE_SEARCH_MAX_RESULTS лучшими, а сортирует их по
+    рангу RecipePagination.
+    """
+    if not use_postgres():
+        return queryset.with_search_ranks(recipe_index.search(
+            query, settings.RECIPE_SEARCH_MAX_RESULTS
+        ))
+    query = SearchQuery(query, config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), FloatField())
+    ).order_by('-rank', '-id')
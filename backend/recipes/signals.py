@@ -0,0 +1,123 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import feed
+from .cooking import cooking_index
+from .counters import update_followers_count, update_recipes_count
+from .images import has_current_variants, schedule_image_processing
+from .ingredient_search import ingredient_index
+from .models import Ingredient, IngredientRecipe, Recipe
+from .search import update_search_vectors
+from users.models import Follow
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredient_index(**kwargs):
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Recipe)
+def count_recipe(instance, created, **kwargs):
+    if created:
+        update_recipes_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def uncount_recipe(instance, **kwargs):
+    update_recipes_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follower(instance, created, **kwargs):
+    if created:
+        update_followers_count(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follower(instance, **kwargs):
+    update_followers_count(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def schedule_recipe_image(instance, **kwargs):
+    if instance.image and not has_current_variants(instance):
+        transaction.on_commit(
+            lambda: schedule_image_processing(instance.pk)
+        )
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=IngredientRecipe)
+def update_recipe_indexes(sender, instance, using, **kwargs):
+    recipe_id = instance.pk if sender is Recipe else instance.recipe_id
+    schedule_reindex(recipe_id, using)
+
+
+@receiver(m2m_changed, sender=IngredientRecipe)
+def update_recipe_ingredients_indexes(
+    instance, action, reverse, using, **kwargs
+):
+    if action.startswith('post_') and not reverse:
+        schedule_reindex(instance.pk, using)
+
+
+def schedule_reindex(recipe_id, using):
+    """Переиндексирует рецепт после фиксации транзакции.
+
+    Рецепты собираются в одно множество на транзакцию, поэтому
+    изменение или удаление рецепта со всеми строками ингредиентов,
+    включая каскадное, переиндексирует его один раз. Если колбэк
+    пропал при откате точки сохранения, он регистрируется заново.
+    """
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        reindex_recipes([recipe_id])
+        return
+    callback = getattr(connection, 'reindex_callback', None)
+    if callback is None or all(
+        func is not callback for _, func in connection.run_on_commit
+    ):
+        recipe_ids = set()
+
+        def callback():
+            reindex_recipes(recipe_ids)
+
+        callback.recipe_ids = recipe_ids
+        connection.reindex_callback = callback
+        transaction.on_commit(callback, using)
+    callback.recipe_ids.add(recipe_id)
+
+
+def reindex_recipes(recipe_ids):
+    update_search_vectors(list(recipe_ids))
+    cooking_index.publish(recipe_ids)
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search(instance, created, **kwargs):
+    if not created:
+        recipe_ids = list(
+            IngredientRecipe.objects.filter(ingredient=instance)
+            .values_list('recipe_id', flat=True)
+        )
+        transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: feed.fan_out(instance))
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        transaction.on_commit(
+            lambda: feed.backfill(instance.user_id, instance.author_id)
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def clear_feed(instance, **kwargs):
+    feed.remove(instance.user_id, instance.author_id)
@@ -7,7 +7,8 @@ from .models import Follow, User
 class UserAdmin(admin.ModelAdmin):
     """Админка пользователей."""
     list_display = (
-        'id', 'username', 'email', 'first_name', 'last_name', 'role'
+        'id', 'username', 'email', 'first_name', 'last_name', 'role',
+        'recipes_count', 'followers_count'
     )
     list_filter = ('email', 'username')
     empty_value_display = '-пусто-'
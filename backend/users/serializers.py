@@ -2,6 +2,7 @@ from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
 from .models import Follow, User
+from api.metrics import SerializerTimingMixin
 
 
 class SignUpSerializer(UserCreateSerializer):
@@ -15,7 +16,7 @@ class SignUpSerializer(UserCreateSerializer):
         )
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(SerializerTimingMixin, UserSerializer):
     """Сериализатор пользователей."""
     is_subscribed = serializers.SerializerMethodField()
 
@@ -27,6 +28,8 @@ class CustomUserSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context.get('request').user
         if not user.is_authenticated:
             return False
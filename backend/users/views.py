@@ -1,7 +1,10 @@
+from django.db import transaction
+from django.db.models import BooleanField, OuterRef, Prefetch, Subquery, Value
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
@@ -9,6 +12,7 @@ from .models import Follow, User
 from .serializers import CustomUserSerializer
 from api.pagination import CustomPagination
 from api.serializers import FollowSerializer
+from recipes.models import Recipe
 
 
 class FollowListViewSet(viewsets.ReadOnlyModelViewSet):
@@ -17,8 +21,36 @@ class FollowListViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
 
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if not recipes_limit:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise ValidationError(
+                'recipes_limit должен быть неотрицательным числом.'
+            )
+        return recipes_limit
+
     def get_queryset(self):
-        return User.objects.filter(following__user=self.request.user)
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            ))
+        return User.objects.filter(
+            following__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
 
 
 class CustomUserViewSet(UserViewSet):
@@ -32,6 +64,7 @@ class CustomUserViewSet(UserViewSet):
         methods=['post', 'delete'],
         permission_classes=[IsAuthenticated]
     )
+    @transaction.atomic
     def subscribe(self, request, id):
         user = request.user
         author = get_object_or_404(User, id=id)